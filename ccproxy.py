@@ -7,30 +7,184 @@ Minimal Claude Code proxy v2 - Modular design
 from __future__ import annotations
 
 import argparse
+import atexit
+import base64
+import copy
+import functools
+import gzip
+import http.cookiejar
+import itertools
 import json
 import logging
+import logging.handlers
+import os
+import queue
+import signal
+import socket
+import sys
 import threading
 import urllib.parse
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from http import HTTPStatus
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # 可选依赖：热路径 JSON 编解码提速，未安装时回退到标准库 json
+except ImportError:
+    orjson = None
 
 ROOT_DIR = Path(__file__).resolve().parent
 WEB_DIR = ROOT_DIR / "web"
 DOCS_DIR = ROOT_DIR / "docs"
+# 静态文件路由：请求路径 -> (文件路径, Content-Type, 是否需要 UI 鉴权)
+STATIC_FILES = {
+    "/": (WEB_DIR / "index.html", "text/html; charset=utf-8", True),
+    "/app.js": (WEB_DIR / "app.js", "application/javascript; charset=utf-8", True),
+    "/styles.css": (WEB_DIR / "styles.css", "text/css; charset=utf-8", True),
+    "/docs": (DOCS_DIR / "index.html", "text/html; charset=utf-8", False),
+}
 STATE_PATH = ROOT_DIR / "proxy_state.json"
+# 状态修改后延迟写盘的时间（秒），期间的多次修改合并为一次写入
+STATE_SAVE_DELAY = 0.1
+STATE_IO_BUFFER_SIZE = 65536
 
-HOP_HEADERS = {
+HOP_HEADERS = frozenset({
     "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
     "te", "trailers", "transfer-encoding", "upgrade", "host",
     "content-length", "accept-encoding",
-}
+    # 请求体由代理读取后再发给上游，客户端的 100-continue 协商不能转发
+    "expect",
+})
+AUTH_HEADERS = frozenset({"authorization", "x-api-key", "anthropic-auth-token"})
+HOP_AND_AUTH_HEADERS = HOP_HEADERS | AUTH_HEADERS
+# 日志中需要隐藏取值的 headers（小写）
+SENSITIVE_HEADERS = AUTH_HEADERS | {"x-goog-api-key", "proxy-authorization", "cookie", "set-cookie"}
+# 启用 Header Override 时移除的浏览器指纹类 headers
+BROWSER_HEADERS = frozenset({"http-referer", "referer", "x-title", "origin", "priority"})
+# 日志中需要隐藏取值的 URL 查询参数（小写）
+SENSITIVE_QS_KEYS = frozenset({"token", "key", "api_key", "apikey"})
+BROWSER_HEADER_PREFIXES = ("sec-ch-", "sec-fetch-")
+# 预处理后的 HeaderOverride：(覆写 headers, 覆写 key 与浏览器 headers 的丢弃集合,
+# 透传模式完整丢弃集合, Override 模式完整丢弃集合)，丢弃集合均为小写 key
+PreparedHeaderOverride = Tuple[Dict[str, str], frozenset, frozenset, frozenset]
+_EMPTY_HEADER_OVERRIDE: PreparedHeaderOverride = ({}, frozenset(), HOP_HEADERS, HOP_AND_AUTH_HEADERS)
+
+# 超过该大小且无需改写的请求体直接流式转发给上游，不在内存中缓存
+STREAM_BODY_MIN_BYTES = 1024 * 1024
+STREAM_CHUNK_SIZE = 65536
+# 定长（有 Content-Length）响应每次读满后再写给客户端，减少 send 次数
+RESPONSE_BUFFER_SIZE = 262144
+# keep-alive 连接等待下一个请求的空闲超时（秒），超时后关闭连接、释放工作线程
+KEEPALIVE_TIMEOUT = 5
+# 异步日志队列容量，队列满时丢弃日志而不阻塞请求线程
+LOG_QUEUE_SIZE = 10000
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+# 根 logger 只获取一次，热路径上的级别判断直接使用
+_ROOT_LOGGER = logging.getLogger()
+# 日志记录响应体时最多保留的字节数：保留开头部分，加上结尾部分
+MAX_LOG_CAPTURE_BYTES = 256 * 1024
+LOG_CAPTURE_TAIL_BYTES = 64 * 1024
+
+# 模型刷新共用的线程池（网络 I/O 密集，线程跨多次刷新复用）
+REFRESH_WORKERS = 16
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="refresh")
+# provider 批量测试共用的线程池（每个测试是一次上游请求，并发数不宜过大）
+TEST_WORKERS = 8
+_TEST_POOL = ThreadPoolExecutor(max_workers=TEST_WORKERS, thread_name_prefix="test")
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志记录并计数，恢复后补一条告警（不阻塞请求线程）"""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "msg": "log: dropped %d records (queue full)" % self.dropped,
+                    "levelno": logging.WARNING, "levelname": "WARNING",
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: int) -> None:
+    """
+    配置异步日志：请求线程只把日志记录放入有界队列，由后台线程统一写出
+    输入: 日志级别
+    输出: 无
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    _ROOT_LOGGER.setLevel(level)
+    _ROOT_LOGGER.addHandler(DroppingQueueHandler(log_queue))
+    listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+
+
+def build_session(pool_size: int) -> requests.Session:
+    """
+    构建带连接池的 requests.Session（keep-alive 复用 TCP/TLS 连接）
+    输入: 每个 host 的连接池大小
+    输出: Session 对象（不保存 cookie，避免不同请求之间串号）
+    """
+    session = requests.Session()
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
+# fetch_models 共用的 Session，连接在刷新线程之间复用
+_MODELS_SESSION = build_session(REFRESH_WORKERS)
+# 上游转发共用的 Session：同一上游的 TCP/TLS 连接在请求之间复用，省去每次握手
+# HTTPAdapter 内部按 scheme+host 为每个上游维护独立的连接池（最多缓存 UPSTREAM_POOL_SIZE 个 host），
+# 无需为每个 provider 单独 mount adapter
+UPSTREAM_POOL_SIZE = 128
+_UPSTREAM_SESSION = build_session(UPSTREAM_POOL_SIZE)
+
+
+def json_dumps_bytes(data: Any) -> bytes:
+    """紧凑 JSON 序列化为 UTF-8 bytes（非 ASCII 字符不转义）"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_dumps_text(data: Any) -> str:
+    """紧凑 JSON 序列化为 str（用于日志输出）"""
+    return json_dumps_bytes(data).decode("utf-8")
+
+
+def json_loads(data: Any) -> Any:
+    """
+    解析 JSON（bytes 或 str），失败时抛出 json.JSONDecodeError
+    orjson 不接受 NaN/Infinity 等标准库可以解析的输入，orjson 解析失败时回退到标准库再试一次
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+@functools.lru_cache(maxsize=512)
 def extract_base_url(api_base_url: str) -> str:
     if "/anthropic/v1/messages" in api_base_url:
         return api_base_url.replace("/anthropic/v1/messages", "")
@@ -45,9 +199,14 @@ def extract_base_url(api_base_url: str) -> str:
     return api_base_url.rstrip("/")
 
 
+@functools.lru_cache(maxsize=512)
 def append_token(url: str, token: str, token_param: str) -> str:
     if not token:
         return url
+    if "#" not in url:
+        # 追加参数不需要解析和重新编码已有的 query，直接拼接
+        sep = "?" if "?" not in url else ("" if url.endswith(("?", "&")) else "&")
+        return f"{url}{sep}{urllib.parse.urlencode(((token_param, token),))}"
     parts = urllib.parse.urlsplit(url)
     query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
     query.append((token_param, token))
@@ -57,6 +216,7 @@ def append_token(url: str, token: str, token_param: str) -> str:
     )
 
 
+@functools.lru_cache(maxsize=512)
 def merge_query(url: str, extra_query: str) -> str:
     if not extra_query:
         return url
@@ -71,62 +231,401 @@ def merge_query(url: str, extra_query: str) -> str:
     )
 
 
+@functools.lru_cache(maxsize=512)
+def replace_apikey_query(client_query: str, client_apikey: str, provider_token: str) -> str:
+    """透传模式：把 query 中包含本地 APIKEY 的参数值替换为 provider token"""
+    replaced_params = []
+    for k, v in urllib.parse.parse_qsl(client_query, keep_blank_values=True):
+        if client_apikey and client_apikey in v:
+            replaced_params.append((k, provider_token))
+        else:
+            replaced_params.append((k, v))
+    return urllib.parse.urlencode(replaced_params) if replaced_params else ""
+
+
+@functools.lru_cache(maxsize=None)
+def load_static_file(file_path: Path) -> Optional[bytes]:
+    """读取静态文件内容（运行期间不变，首次读取后缓存在内存中），文件不存在时返回 None"""
+    try:
+        return file_path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+@functools.lru_cache(maxsize=512)
+def strip_token_query(client_query: str) -> str:
+    """Override 模式：移除 query 中客户端的 token 参数"""
+    filtered_params = [(k, v) for k, v in urllib.parse.parse_qsl(client_query, keep_blank_values=True)
+                       if k.lower() not in SENSITIVE_QS_KEYS]
+    return urllib.parse.urlencode(filtered_params) if filtered_params else ""
+
+
+@functools.lru_cache(maxsize=512)
+def build_upstream_url(api_base_url: str, client_query: str, client_apikey: str, provider_token: str,
+                       token_in: str = "", query_params: str = "", token_param: str = "") -> str:
+    """
+    构建上游 URL（纯函数，按全部输入缓存）
+    输入: provider URL, 客户端 query, 本地 APIKEY, provider token, token_in, 额外 query 参数, token 参数名
+    输出: 上游 URL
+    """
+    if not token_in:
+        # 透传模式：处理 query 参数
+        return merge_query(api_base_url, replace_apikey_query(client_query, client_apikey, provider_token))
+
+    # Override 模式：移除客户端的 token 参数
+    url = merge_query(api_base_url, strip_token_query(client_query))
+    # 注入额外的查询参数
+    if query_params:
+        url = merge_query(url, query_params)
+    # 根据 token_in 配置添加认证
+    if token_in in ("query", "both"):
+        url = append_token(url, provider_token, token_param)
+    return url
+
+
+@functools.lru_cache(maxsize=512)
+def split_url_for_log(url: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """拆分 URL 用于日志：返回不含 query 的 URL 和脱敏后的 query 参数"""
+    parsed_url = urllib.parse.urlsplit(url)
+    query_dict = dict(urllib.parse.parse_qsl(parsed_url.query))
+    return (parsed_url._replace(query="").geturl(),
+            tuple((k, "***" if k.lower() in SENSITIVE_QS_KEYS else v) for k, v in query_dict.items()))
+
+
+def iter_chunked_body(rfile: BinaryIO) -> Iterator[memoryview]:
+    """
+    逐块解码 chunked 编码的请求体
+    输入: 客户端输入流
+    输出: 解码后的数据块迭代器（memoryview，去掉结尾 CRLF 时不复制数据）
+    """
+    while True:
+        line = rfile.readline()
+        if not line:
+            return
+        size_str = line.split(b";", 1)[0].strip()
+        try:
+            size = int(size_str, 16)
+        except ValueError:
+            return
+        if size == 0:
+            while True:
+                tail = rfile.readline()
+                if not tail or tail in (b"\r\n", b"\n"):
+                    return
+        # 数据和结尾的 CRLF 一次读出
+        data = rfile.read(size + 2)
+        yield memoryview(data)[:size]
+
+
+class BodyStream:
+    """按 Content-Length 限长的客户端请求体读取器，交给 requests 边读边发，不在内存中缓存整个请求体"""
+
+    def __init__(self, rfile: BinaryIO, length: int) -> None:
+        self._rfile = rfile
+        self._length = length
+        self._remaining = length
+        # 读取客户端时发生的错误（如超时）：requests 会把它包装成上游错误，由调用方据此区分
+        self.error: Optional[OSError] = None
+
+    def __len__(self) -> int:
+        # requests 据此设置上游的 Content-Length
+        return self._length
+
+    @property
+    def remaining(self) -> int:
+        """尚未读取的字节数"""
+        return self._remaining
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        try:
+            data = self._rfile.read(size)
+        except OSError as exc:
+            self.error = exc
+            raise
+        self._remaining = self._remaining - len(data) if data else 0
+        return data
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class SSELogParser:
+    """
+    增量解析 SSE 响应用于日志：数据块到达时逐个事件解析，不保留完整响应体
+    文本/思考增量合并输出，其余事件原样记录；日志行合并为多行日志输出，
+    累计超过 MAX_LOG_CAPTURE_BYTES 时先输出一部分，close() 时输出剩余部分
+    """
+
+    def __init__(self, log_prefix: str) -> None:
+        self._pending = bytearray()
+        self._text: List[str] = []
+        self._thinking: List[str] = []
+        self._out = ["%s: response_body (SSE stream):" % log_prefix]
+        self._out_size = 0
+
+    def _emit(self, line: str) -> None:
+        self._out.append(line)
+        self._out_size += len(line)
+        if self._out_size >= MAX_LOG_CAPTURE_BYTES:
+            logging.debug("%s", "\n".join(self._out))
+            self._out = []
+            self._out_size = 0
+
+    def feed(self, chunk: bytes) -> None:
+        """追加数据块，解析其中所有完整的事件（以空行分隔）"""
+        pending = self._pending
+        pending += chunk
+        start = 0
+        while True:
+            end = pending.find(b"\n\n", start)
+            if end < 0:
+                break
+            self._handle_event(pending[start:end])
+            start = end + 2
+        if start:
+            del pending[:start]
+        elif len(pending) > MAX_LOG_CAPTURE_BYTES:
+            # 异常的超长事件不再缓存，避免内存无限增长
+            self._emit("  [data] (event larger than %d bytes omitted)" % MAX_LOG_CAPTURE_BYTES)
+            pending.clear()
+
+    def close(self) -> None:
+        """解析剩余数据并输出日志"""
+        if self._pending.strip():
+            self._handle_event(self._pending)
+        self._pending = bytearray()
+        self._flush_deltas()
+        if self._out:
+            logging.debug("%s", "\n".join(self._out))
+            self._out = []
+
+    def _flush_deltas(self) -> None:
+        if self._text:
+            self._emit("  [content_block_delta] accumulated_text:\n" + "".join(self._text))
+            self._text = []
+        if self._thinking:
+            self._emit("  [content_block_delta] accumulated_thinking:\n" + "".join(self._thinking))
+            self._thinking = []
+
+    def _handle_event(self, raw: bytearray) -> None:
+        # 在 bytes 上按行扫描，data 直接按 bytes 解析 JSON，只有需要原样记录时才解码
+        event_type = ""
+        for line in bytes(raw).strip().split(b"\n"):
+            if line.startswith(b"event:"):
+                event_type = line[6:].strip().decode("utf-8", errors="replace")
+            elif line.startswith(b"data:"):
+                payload = line[5:].strip()
+                if event_type and event_type != "content_block_delta":
+                    # 其他具名事件只需原样记录，不解析 JSON
+                    self._flush_deltas()
+                    self._emit("  [%s] %s" % (event_type, payload.decode("utf-8", errors="replace")))
+                    continue
+                # 增量事件都是 JSON 对象；[DONE] 之类的非对象数据直接记录，不走解析失败的异常路径
+                if not payload.startswith(b"{"):
+                    self._emit("  [%s] %s" % (event_type or "data", payload.decode("utf-8", errors="replace")))
+                    continue
+                try:
+                    data = json_loads(payload)
+                    # Chat Completions 格式
+                    if "choices" in data:
+                        content = data.get("choices", [{}])[0].get("delta", {}).get("content")
+                        if content:
+                            self._text.append(content)
+                        continue
+                    # Claude Messages 格式
+                    delta_type = data.get("delta", {}).get("type")
+                    if event_type == "content_block_delta" and delta_type == "text_delta":
+                        self._text.append(data["delta"]["text"])
+                        continue
+                    if event_type == "content_block_delta" and delta_type == "thinking_delta":
+                        self._thinking.append(data["delta"]["thinking"])
+                        continue
+                    self._flush_deltas()
+                except (ValueError, AttributeError, LookupError, TypeError):
+                    # JSON 无效或结构不符合预期：按原样记录
+                    pass
+                # 直接记录原始 data 文本，无需重新序列化
+                self._emit("  [%s] %s" % (event_type or "data", payload.decode("utf-8", errors="replace")))
+
+
+# ProxyRequest 请求体尚未解析的标记
+_UNPARSED = object()
+
+# 客户端 headers：(原始 key, 小写 key, value) 三元组，小写形式每个请求只计算一次
+HeaderItems = Tuple[Tuple[str, str, str], ...]
+
+
+def lower_header_items(headers: Any) -> HeaderItems:
+    """把 headers（dict 或 HTTPMessage）转换为带小写 key 的三元组"""
+    # HTTPMessage.raw_items() 直接迭代原始 (key, value)，不像 items() 那样先构建列表并逐个做 policy 处理
+    raw_items = getattr(headers, "raw_items", None)
+    return tuple((k, k.lower(), v) for k, v in (raw_items() if raw_items is not None else headers.items()))
+
+
+# 请求体：已完整读取的 bytes，或流式读取器
+RequestBody = Union[bytes, BodyStream]
+
+
 class ProxyState:
-    """统一管理配置和运行时数据"""
+    """统一管理配置和运行时数据
+
+    运行时 providers 采用写时复制：读取方直接拿到不可变的 tuple 快照（无锁），
+    写入方在 _lock 下构建新的 tuple 并整体替换引用。
+    用户状态 _state 由独立的 _state_lock 保护，与 providers/config 的写入互不阻塞；
+    错误计数使用 itertools.count，不需要锁。
+    """
 
     def __init__(self, config: Dict[str, Any], config_path: Path) -> None:
-        self._lock = threading.Lock()
+        self._lock = threading.Lock()  # providers / config 快照
+        self._state_lock = threading.Lock()  # 用户状态 _state
+        self._version_lock = threading.Lock()  # 状态版本号
         self._config = config
-        self._initial_config = json.loads(json.dumps(config))
+        self._initial_config = copy.deepcopy(config)
         self._config_path = config_path
+        self._header_overrides = self._prepare_header_overrides(config)
+        self._apikey, self._token_param, self._api_timeout = self._parse_config_scalars(config)
         self._state = self._load_state()
-        self._runtime_providers = self._init_providers()
-        self._error_counts: Dict[str, int] = {}
+        self._runtime_providers = self._init_providers(config)
+        self._provider_index = self._build_provider_index(self._runtime_providers)
+        self._error_counters: Dict[str, Iterator[int]] = {}
         self._error_threshold = config.get("ERROR_THRESHOLD", 3)
-
-    def _init_providers(self) -> List[Dict[str, Any]]:
+        self._log_response_body = bool(config.get("LOG_RESPONSE_BODY", True))
+        self._client_write_timeout = float(config.get("CLIENT_WRITE_TIMEOUT", 60))
+        self._client_read_timeout = float(config.get("CLIENT_READ_TIMEOUT", 60))
+        # 状态版本号：任何写操作都会递增，用于 /api/state 的 ETag 和派生数据缓存
+        # 以启动时间（毫秒）为起点，避免重启后与浏览器缓存的旧 ETag 撞号
+        self._version = int(time.time() * 1000)
+        self._derived_cache: Dict[str, Tuple[int, Any]] = {}
+        # 状态文件由后台线程延迟写入，合并短时间内的多次修改
+        self._state_dirty = threading.Event()
+        threading.Thread(target=self._state_writer, daemon=True, name="state_writer").start()
+
+    @staticmethod
+    def _init_providers(config: Dict[str, Any]) -> Tuple[Dict[str, Any], ...]:
         """从 config 初始化运行时 providers（深拷贝）"""
-        return [dict(p) for p in self._config.get("Providers", [])]
+        return tuple(dict(p) for p in config.get("Providers", []))
+
+    @staticmethod
+    def _build_provider_index(providers: Tuple[Dict[str, Any], ...]) -> Dict[str, int]:
+        """构建 provider 名称 -> 下标的索引（重名时保留第一个，与线性查找一致）"""
+        index: Dict[str, int] = {}
+        for i, p in enumerate(providers):
+            index.setdefault(p.get("name", ""), i)
+        return index
+
+    @staticmethod
+    def _parse_config_scalars(config: Dict[str, Any]) -> Tuple[str, str, Optional[float]]:
+        """预解析每个请求都会读取的配置项：(APIKEY, TOKEN_PARAM, API_TIMEOUT_MS 换算的秒数，无效时为 None)"""
+        try:
+            api_timeout: Optional[float] = float(config.get("API_TIMEOUT_MS", "600000")) / 1000.0
+        except (TypeError, ValueError):
+            api_timeout = None
+        return config.get("APIKEY", ""), config.get("TOKEN_PARAM", "token"), api_timeout
+
+    @staticmethod
+    def _prepare_header_overrides(config: Dict[str, Any]) -> Dict[str, PreparedHeaderOverride]:
+        """预处理 HeaderOverrides：name -> 覆写 headers 及预先合并好的丢弃集合（请求时不再做集合运算）"""
+        prepared = {}
+        for name, headers in config.get("HeaderOverrides", {}).items():
+            if headers:
+                override_drop = BROWSER_HEADERS | {k.lower() for k in headers}
+                prepared[name] = (headers, override_drop,
+                                  HOP_HEADERS | override_drop, HOP_AND_AUTH_HEADERS | override_drop)
+        return prepared
+
+    def _replace_provider(self, name: str, **fields: Any) -> None:
+        """写时复制：替换指定 provider 的字段并发布新的快照（调用方需持有 _lock）"""
+        i = self._provider_index.get(name)
+        if i is None:
+            return
+        providers = list(self._runtime_providers)
+        providers[i] = {**providers[i], **fields}
+        self._runtime_providers = tuple(providers)
+        self._bump_version()
+
+    def _bump_version(self) -> None:
+        """递增状态版本号（providers 和 _state 的写入方持有不同的锁，版本号单独加锁）"""
+        with self._version_lock:
+            self._version += 1
 
     def _load_state(self) -> Dict[str, Any]:
         """加载用户状态（selected_provider, provider_overrides）"""
         if STATE_PATH.exists():
-            with STATE_PATH.open("r", encoding="utf-8") as f:
-                return json.load(f)
+            with STATE_PATH.open("rb", buffering=STATE_IO_BUFFER_SIZE) as f:
+                return json_loads(f.read())
         return {}
 
     def save_state(self) -> None:
-        """保存用户状态到 state.json"""
+        """标记用户状态需要保存（由后台线程延迟写入 state.json，不阻塞请求线程）"""
+        self._state_dirty.set()
+
+    def flush_state(self) -> None:
+        """立即写入尚未保存的用户状态（退出时调用）"""
+        if self._state_dirty.is_set():
+            self._state_dirty.clear()
+            self._write_state()
+
+    def _state_writer(self) -> None:
+        """后台线程：等待状态变化，延迟 STATE_SAVE_DELAY 秒后合并写入"""
+        while True:
+            self._state_dirty.wait()
+            time.sleep(STATE_SAVE_DELAY)
+            self._state_dirty.clear()
+            self._write_state()
+
+    def _write_state(self) -> None:
+        """保存用户状态到 state.json（先写临时文件再替换，写入中断时保留旧文件）"""
+        with self._state_lock:
+            data = json.dumps(self._state, indent=2, ensure_ascii=True).encode("ascii")
+        tmp_path = STATE_PATH.with_name(STATE_PATH.name + ".tmp")
         try:
-            with STATE_PATH.open("w", encoding="utf-8") as f:
-                json.dump(self._state, f, indent=2, ensure_ascii=True)
+            with tmp_path.open("wb", buffering=STATE_IO_BUFFER_SIZE) as f:
+                f.write(data)
+            os.replace(tmp_path, STATE_PATH)
         except OSError as exc:
             logging.warning("state: failed to persist proxy_state.json (%s)", exc)
 
-    def get_providers(self) -> List[Dict[str, Any]]:
-        """获取运行时 providers（包含 models, test_result）"""
-        with self._lock:
-            return list(self._runtime_providers)
+    def get_providers(self) -> Tuple[Dict[str, Any], ...]:
+        """获取运行时 providers 快照（包含 models, test_result），只读"""
+        return self._runtime_providers
+
+    def get_provider(self, name: str) -> Optional[Dict[str, Any]]:
+        """按名称获取 provider（通过名称索引 O(1) 查找）"""
+        providers = self._runtime_providers
+        i = self._provider_index.get(name)
+        if i is not None and i < len(providers) and providers[i].get("name") == name:
+            return providers[i]
+        # 读取期间快照恰好被整体替换时，索引与快照可能不一致，退回线性查找
+        return next((p for p in providers if p.get("name") == name), None)
 
     def get_selected_provider(self) -> Optional[Dict[str, Any]]:
         """获取当前选中的 provider"""
-        with self._lock:
-            if self._state.get("selection_required"):
-                return None
-            selected = self._state.get("selected_provider")
-            if selected:
-                for p in self._runtime_providers:
-                    if p.get("name") == selected:
-                        return p
-            return self._runtime_providers[0] if self._runtime_providers else None
+        if self._state.get("selection_required"):
+            return None
+        selected = self._state.get("selected_provider")
+        if selected:
+            provider = self.get_provider(selected)
+            if provider is not None:
+                return provider
+        providers = self._runtime_providers
+        return providers[0] if providers else None
 
     def set_selected_provider(self, name: str) -> bool:
         """设置选中的 provider"""
-        with self._lock:
-            if any(p.get("name") == name for p in self._runtime_providers):
+        with self._state_lock:
+            if name in self._provider_index:
                 self._state["selected_provider"] = name
                 if self._state.get("selection_required"):
                     self._state["selection_required"] = False
+                self._bump_version()
                 self.save_state()
                 return True
         return False
@@ -134,91 +633,162 @@ class ProxyState:
     def update_provider_models(self, name: str, models: List[str]) -> None:
         """更新 provider 的 models"""
         with self._lock:
-            for p in self._runtime_providers:
-                if p.get("name") == name:
-                    p["models"] = models
-                    break
+            self._replace_provider(name, models=models)
 
     def set_test_result(self, name: str, success: bool) -> None:
         """设置 provider 的测试结果"""
         with self._lock:
-            for p in self._runtime_providers:
-                if p.get("name") == name:
-                    p["test_result"] = success
-                    break
+            self._replace_provider(name, test_result=success)
 
     def reload_config(self) -> None:
         """重新加载 config，重置运行时数据"""
+        # 读取和预处理放在锁外，锁内只做引用替换
+        try:
+            with self._config_path.open("r", encoding="utf-8-sig") as f:
+                config = json.load(f)
+        except OSError as exc:
+            logging.warning("config: failed to reload (%s)", exc)
+            return
+        header_overrides = self._prepare_header_overrides(config)
+        scalars = self._parse_config_scalars(config)
+        providers = self._init_providers(config)
+        provider_index = self._build_provider_index(providers)
         with self._lock:
-            try:
-                with self._config_path.open("r", encoding="utf-8-sig") as f:
-                    config = json.load(f)
-            except OSError as exc:
-                logging.warning("config: failed to reload (%s)", exc)
-                return
             self._config = config
-            self._runtime_providers = self._init_providers()
+            self._header_overrides = header_overrides
+            self._apikey, self._token_param, self._api_timeout = scalars
+            self._runtime_providers = providers
+            self._provider_index = provider_index
+        self._bump_version()
+        with self._state_lock:
             selected = self._state.get("selected_provider")
-            if selected and any(p.get("name") == selected for p in self._runtime_providers):
+            if selected and selected in provider_index:
                 return
-            if self._runtime_providers:
-                self._state["selected_provider"] = self._runtime_providers[0].get("name", "")
+            if providers:
+                self._state["selected_provider"] = providers[0].get("name", "")
                 self.save_state()
 
     def reset_config(self) -> None:
         """重置到初始配置"""
+        # 拷贝和预处理放在锁外，锁内只做引用替换
+        config = copy.deepcopy(self._initial_config)
+        header_overrides = self._prepare_header_overrides(config)
+        scalars = self._parse_config_scalars(config)
+        providers = self._init_providers(config)
+        provider_index = self._build_provider_index(providers)
         with self._lock:
-            self._config = json.loads(json.dumps(self._initial_config))
-            self._runtime_providers = self._init_providers()
+            self._config = config
+            self._header_overrides = header_overrides
+            self._apikey, self._token_param, self._api_timeout = scalars
+            self._runtime_providers = providers
+            self._provider_index = provider_index
+        with self._state_lock:
             self._state["selected_provider"] = ""
             self._state["selection_required"] = True
             self._state["global_override"] = {}  # 清空统一的 override
             self.save_state()
+        self._bump_version()
 
     def get_provider_override(self, name: str) -> Dict[str, Any]:
         """获取统一的覆写配置（所有 provider 共享）"""
-        with self._lock:
-            return dict(self._state.get("global_override", {}))
+        return dict(self._state.get("global_override", {}))
 
     def set_provider_override(self, name: str, override: Dict[str, Any]) -> None:
         """设置统一的覆写配置（所有 provider 共享）"""
-        with self._lock:
+        with self._state_lock:
             self._state["global_override"] = override
+            self._bump_version()
             self.save_state()
 
+    def get_version(self) -> int:
+        """获取状态版本号"""
+        return self._version
+
+    def get_cached(self, key: str, build: Callable[[], Any]) -> Tuple[int, Any]:
+        """
+        按状态版本号缓存派生数据（如序列化后的 /api/state），状态变化后自动失效
+        输入: 缓存 key, 构建函数
+        输出: (版本号, 数据)
+        """
+        version = self._version
+        cached = self._derived_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached
+        value = build()
+        # 构建期间若状态发生变化，缓存仍标记为旧版本号，下次读取时会重新构建
+        self._derived_cache[key] = (version, value)
+        return version, value
+
     def get_config(self, key: str, default: Any = None) -> Any:
         """获取配置项"""
         return self._config.get(key, default)
 
+    def get_apikey(self) -> str:
+        """获取本地 APIKEY（未配置时为空字符串）"""
+        return self._apikey
+
+    def get_token_param(self) -> str:
+        """获取默认的 token 查询参数名（TOKEN_PARAM）"""
+        return self._token_param
+
+    def get_api_timeout(self, default: float, cap: Optional[float] = None) -> float:
+        """
+        获取 API_TIMEOUT_MS 换算后的超时时间（秒）
+        输入: 配置无效时的默认值, 可选的上限
+        输出: 超时时间（秒）
+        """
+        timeout = self._api_timeout
+        if timeout is None:
+            return default
+        return min(timeout, cap) if cap is not None else timeout
+
     def get_header_overrides(self) -> Dict[str, Dict[str, str]]:
         """获取 header 覆写配置"""
         return self._config.get("HeaderOverrides", {})
 
+    def get_prepared_header_override(self, name: str) -> PreparedHeaderOverride:
+        """获取预处理后的 header 覆写，不存在时返回只丢弃 hop-by-hop（及认证）headers 的空覆写"""
+        return self._header_overrides.get(name, _EMPTY_HEADER_OVERRIDE)
+
     def get_request_overrides(self) -> Dict[str, Dict[str, Any]]:
         """获取 request 覆写配置"""
         return self._config.get("RequestOverrides", {})
 
     def increment_error_count(self, provider_name: str) -> int:
-        """增加错误计数"""
-        with self._lock:
-            self._error_counts[provider_name] = self._error_counts.get(provider_name, 0) + 1
-            return self._error_counts[provider_name]
+        """增加错误计数（itertools.count 的 next() 在 GIL 下是原子的，无需加锁）"""
+        counter = self._error_counters.get(provider_name)
+        if counter is None:
+            counter = self._error_counters.setdefault(provider_name, itertools.count(1))
+        return next(counter)
 
     def reset_error_count(self, provider_name: str) -> None:
-        """重置错误计数"""
-        with self._lock:
-            self._error_counts[provider_name] = 0
+        """重置错误计数（成功请求的常见路径：没有错误记录时只是一次字典查找，不分配新计数器）"""
+        if provider_name in self._error_counters:
+            # 删除计数器，下次出错时由 increment_error_count 重新从 1 开始计数
+            self._error_counters.pop(provider_name, None)
 
     def get_error_threshold(self) -> int:
         """获取错误阈值"""
         return self._error_threshold
 
+    def log_response_body(self) -> bool:
+        """是否在 DEBUG 日志中记录响应体（LOG_RESPONSE_BODY，默认开启）"""
+        return self._log_response_body
+
+    def get_client_write_timeout(self) -> float:
+        """获取向客户端写响应的超时时间（秒），客户端长时间不读取时放弃转发"""
+        return self._client_write_timeout
+
+    def get_client_read_timeout(self) -> float:
+        """获取读取客户端请求体的超时时间（秒），客户端长时间不发送请求体时放弃读取"""
+        return self._client_read_timeout
+
 
 class ProxyRequest:
     """构建代理请求"""
 
     def __init__(self, provider: Dict[str, Any], override: Dict[str, Any],
-                 client_headers: Dict[str, str], client_query: str, client_body: bytes,
+                 client_headers: HeaderItems, client_query: str, client_body: RequestBody,
                  state: ProxyState):
         self.provider = provider
         self.override = override
@@ -227,110 +797,102 @@ class ProxyRequest:
         self.client_body = client_body
         self.state = state
         self.provider_token = provider.get("token") or provider.get("api_key") or ""
-        self.client_apikey = state.get_config("APIKEY", "")
+        self.client_apikey = state.get_apikey()
         self.token_in = override.get("token_in") or provider.get("token_in", "")
         if self.token_in:
             self.token_in = str(self.token_in).lower()
+        self._body_data: Any = _UNPARSED
 
     def build_url(self) -> str:
-        """构建上游 URL"""
+        """构建上游 URL（结果按全部输入缓存，同一 provider 的稳定流量不再重复解析 URL）"""
         api_base_url = self.provider.get("api_base_url", "")
-
         if not self.token_in:
-            # 透传模式：处理 query 参数
-            query_params = urllib.parse.parse_qsl(self.client_query, keep_blank_values=True)
-            replaced_params = []
-            for k, v in query_params:
-                if self.client_apikey and self.client_apikey in v:
-                    replaced_params.append((k, self.provider_token))
-                else:
-                    replaced_params.append((k, v))
-            client_query = urllib.parse.urlencode(replaced_params) if replaced_params else ""
-            url = merge_query(api_base_url, client_query)
-        else:
-            # Override 模式：移除客户端的 token 参数
-            query_params = urllib.parse.parse_qsl(self.client_query, keep_blank_values=True)
-            filtered_params = [(k, v) for k, v in query_params
-                             if k.lower() not in ("token", "key", "api_key", "apikey")]
-            client_query = urllib.parse.urlencode(filtered_params) if filtered_params else ""
-            url = merge_query(api_base_url, client_query)
-
-            # 注入额外的查询参数
-            if self.override and self.override.get("query_params"):
-                url = merge_query(url, self.override.get("query_params", ""))
-
-            # 根据 token_in 配置添加认证
-            if self.token_in in ("query", "both"):
-                token_param = self.override.get("token_param") or self.provider.get("token_param") or self.state.get_config("TOKEN_PARAM", "token")
-                url = append_token(url, self.provider_token, token_param)
-
-        return url
+            return build_upstream_url(api_base_url, self.client_query, self.client_apikey, self.provider_token)
+        query_params = self.override.get("query_params", "") if self.override else ""
+        token_param = ""
+        if self.token_in in ("query", "both"):
+            token_param = self.override.get("token_param") or self.provider.get("token_param") or self.state.get_token_param()
+        return build_upstream_url(api_base_url, self.client_query, self.client_apikey, self.provider_token,
+                                  self.token_in, query_params, token_param)
 
     def build_headers(self) -> Dict[str, str]:
-        """构建上游 headers"""
-        if not self.token_in:
-            # 透传模式：复制客户端 headers，替换包含 APIKEY 的项
-            headers = {}
-            for k, v in self.client_headers.items():
-                if k.lower() not in HOP_HEADERS:
-                    if self.client_apikey and self.client_apikey in v:
-                        # 保留原有格式（如 Bearer 前缀），只替换 token
-                        headers[k] = v.replace(self.client_apikey, self.provider_token)
-                    else:
-                        headers[k] = v
-        else:
-            # Override 模式：移除客户端的认证 headers
-            AUTH_HEADERS = {"authorization", "x-api-key", "anthropic-auth-token"}
-            headers = {
-                k: v
-                for k, v in self.client_headers.items()
-                if k.lower() not in HOP_HEADERS and k.lower() not in AUTH_HEADERS
-            }
+        """构建上游 headers（单次遍历客户端 headers，每个 header 只做一次集合查找和一次前缀判断）"""
+        # Header Override：覆写的 key 以及浏览器指纹类 headers 都要从客户端 headers 中移除
+        header_override = self.override.get("header_override") or self.provider.get("header_override", "")
+        override_headers, override_drop, passthrough_drop, override_mode_drop = \
+            self.state.get_prepared_header_override(header_override)
 
-            # 根据 token_in 配置添加认证
-            if self.token_in in ("header", "both"):
-                header_name = self.override.get("token_header") or self.provider.get("token_header", "Authorization")
-                header_format = self.override.get("token_header_format") or self.provider.get("token_header_format", "Bearer {token}")
-                headers[header_name] = header_format.format(token=self.provider_token)
+        # 透传模式只丢弃 hop-by-hop headers；Override 模式额外移除客户端的认证 headers
+        drop = passthrough_drop if not self.token_in else override_mode_drop
+        drop_browser_prefix = bool(override_headers)
 
-        # 应用 Header Override
-        header_override = self.override.get("header_override") or self.provider.get("header_override", "")
-        if header_override:
-            overrides = self.state.get_header_overrides()
-            override_headers = overrides.get(header_override, {})
-            if override_headers:
-                override_keys_lower = {k.lower(): k for k in override_headers.keys()}
-                headers = {k: v for k, v in headers.items() if k.lower() not in override_keys_lower}
-                browser_headers = {'http-referer', 'referer', 'x-title', 'origin', 'priority'}
-                headers = {k: v for k, v in headers.items()
-                          if not (k.lower() in browser_headers or
-                                 k.lower().startswith('sec-ch-') or
-                                 k.lower().startswith('sec-fetch-'))}
-                headers.update(override_headers)
+        apikey = self.client_apikey if not self.token_in else ""
+        headers = {}
+        for k, kl, v in self.client_headers:
+            if kl in drop or (drop_browser_prefix and kl.startswith(BROWSER_HEADER_PREFIXES)):
+                continue
+            if apikey and apikey in v:
+                # 透传模式：保留原有格式（如 Bearer 前缀），只替换 token
+                v = v.replace(apikey, self.provider_token)
+            headers[k] = v
+
+        # Override 模式：根据 token_in 配置添加认证
+        if self.token_in in ("header", "both"):
+            header_name = self.override.get("token_header") or self.provider.get("token_header", "Authorization")
+            header_format = self.override.get("token_header_format") or self.provider.get("token_header_format", "Bearer {token}")
+            name_lower = header_name.lower()
+            if not (name_lower in override_drop or (drop_browser_prefix and name_lower.startswith(BROWSER_HEADER_PREFIXES))):
+                headers[header_name] = header_format.format(token=self.provider_token)
 
+        if override_headers:
+            headers.update(override_headers)
         return headers
 
-    def build_body(self) -> bytes:
-        """构建上游请求体"""
+    @staticmethod
+    def resolve_inject_fields(override: Dict[str, Any], state: ProxyState) -> Optional[Dict[str, Any]]:
+        """获取需要注入到请求体的字段（request_override 优先，其次 request_inject）"""
         inject_fields = None
-        if self.override:
-            override_name = self.override.get("request_override")
+        if override:
+            override_name = override.get("request_override")
             if override_name:
-                overrides = self.state.get_request_overrides()
+                overrides = state.get_request_overrides()
                 inject_fields = overrides.get(override_name)
-            if not inject_fields and self.override.get("request_inject"):
-                inject_fields = self.override.get("request_inject")
+            if not inject_fields and override.get("request_inject"):
+                inject_fields = override.get("request_inject")
+        return inject_fields
 
+    def get_body_data(self) -> Any:
+        """
+        获取解析后的请求体（整个请求只解析一次，注入字段后返回注入后的结果）
+        输出: JSON 数据；流式请求体或非 JSON 请求体返回 None
+        """
+        if self._body_data is _UNPARSED:
+            self._body_data = None
+            if isinstance(self.client_body, bytes):
+                # 请求体可能被注入字段后重新序列化，使用标准库解析：
+                # orjson 会把超过 64 位的整数转成 float，重新序列化后与客户端发送的值不一致
+                try:
+                    self._body_data = json.loads(self.client_body)
+                except ValueError:
+                    pass
+        return self._body_data
+
+    def build_body(self) -> RequestBody:
+        """构建上游请求体（无需注入字段时原样返回，流式请求体不会被读取）"""
+        inject_fields = self.resolve_inject_fields(self.override, self.state)
         if inject_fields:
-            try:
-                ordered = json.loads(self.client_body)
-                # 注入/覆盖字段
+            data = self.get_body_data()
+            if isinstance(data, dict):
+                # 注入/覆盖字段：已有字段原位覆盖，新字段追加在末尾
                 # 通常用于：补充核心字段（system, tools, metadata）和增加配置字段（max_tokens, stream, thinking）
-                for k, v in inject_fields.items():
-                    ordered[k] = v
-                return json.dumps(ordered, separators=(',', ':')).encode("utf-8")
-            except Exception:
-                pass
+                merged = {**data, **inject_fields}
+                # 与 get_body_data 一致使用标准库序列化：保留大整数和 NaN/Infinity（orjson 会报错或改写）
+                try:
+                    body = json.dumps(merged, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                except (TypeError, ValueError):
+                    return self.client_body
+                self._body_data = merged
+                return body
 
         return self.client_body
 
@@ -357,7 +919,7 @@ def fetch_models(provider: Dict[str, Any], token_param: str, timeout: float,
         header_format = (override or {}).get("token_header_format") or provider.get("token_header_format", "Bearer {token}")
         headers[header_name] = header_format.format(token=token)
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout)
+        resp = _MODELS_SESSION.get(url, headers=headers, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
         models = [m.get("id") for m in data.get("data", []) if m.get("id")]
@@ -381,26 +943,47 @@ def refresh_all_models(state: ProxyState) -> None:
     输入: ProxyState 对象
     输出: 无（直接更新 state）
     """
-    token_param = state.get_config("TOKEN_PARAM", "token")
-    timeout_ms = state.get_config("API_TIMEOUT_MS", "600000")
-    try:
-        timeout = min(float(timeout_ms) / 1000.0, 10.0)
-    except (TypeError, ValueError):
-        timeout = 10.0
-    for provider in state.get_providers():
-        if provider.get("name") == "Note":
-            continue
-        override = state.get_provider_override(provider.get("name", ""))
-        models, error = fetch_models(provider, token_param, timeout, override)
+    token_param = state.get_token_param()
+    timeout = state.get_api_timeout(10.0, cap=10.0)
+    futures = {
+        _REFRESH_POOL.submit(fetch_models, p, token_param, timeout,
+                             state.get_provider_override(p.get("name", ""))): p.get("name", "")
+        for p in state.get_providers() if p.get("name") != "Note"
+    }
+    for future in as_completed(futures):
+        name = futures[future]
+        models, error = future.result()
         if models:
-            state.update_provider_models(provider.get("name", ""), models)
+            state.update_provider_models(name, models)
         elif error:
-            logging.info("models: refresh failed provider=%s error=%s", provider.get("name", ""), error)
+            logging.info("models: refresh failed provider=%s error=%s", name, error)
 
 
 class ProxyHandler(BaseHTTPRequestHandler):
     """HTTP 请求处理器"""
     server_version = "ClaudeProxy/0.2"
+    # HTTP/1.1：客户端连接默认 keep-alive，连续请求无需重新建立 TCP 连接
+    protocol_version = "HTTP/1.1"
+    # 路由表：路径 -> (处理方法名, 是否需要 UI 鉴权)
+    GET_ROUTES = {
+        "/api/state": ("_handle_state", True),
+        "/v1/models": ("_handle_models", False),
+    }
+    POST_ROUTES = {
+        "/api/select": ("_handle_select", True),
+        "/api/refresh-models": ("_handle_refresh_models", True),
+        "/api/reload": ("_handle_reload", True),
+        "/api/reset": ("_handle_reset", True),
+        "/api/provider-auth": ("_handle_provider_auth", True),
+        "/api/test-provider": ("_handle_test_provider", True),
+        "/api/refresh-and-test": ("_handle_refresh_and_test", True),
+        "/api/retest-failed": ("_handle_retest_failed", True),
+        "/v1/messages": ("_proxy_messages", False),
+        "/v1/chat/completions": ("_proxy_messages", False),
+        "/v1/responses": ("_proxy_messages", False),
+    }
+    # 客户端输入流使用 64KB 缓冲，减少读取请求体（尤其是 chunked 小块）时的 recv 调用次数
+    rbufsize = 65536
 
     def _read_json_body(self) -> Optional[Dict[str, Any]]:
         """
@@ -409,8 +992,10 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输出: 解析后的字典，如果解析失败则返回 None 并发送错误响应
         """
         body = self._read_body()
+        if body is None:
+            return None
         try:
-            return json.loads(body or b"{}")
+            return json_loads(body or b"{}")
         except json.JSONDecodeError:
             self._send_json({"error": "invalid_json"}, status=400)
             return None
@@ -421,11 +1006,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: ProxyState 对象
         输出: 超时时间（秒）
         """
-        timeout_ms = state.get_config("API_TIMEOUT_MS", "600000")
-        try:
-            return min(float(timeout_ms) / 1000.0, 10.0)
-        except (TypeError, ValueError):
-            return 10.0
+        return state.get_api_timeout(10.0, cap=10.0)
 
     def _run_background_task(self, task_func, task_name: str) -> None:
         """
@@ -441,7 +1022,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: 数据字典, HTTP 状态码
         输出: 无（直接写入响应）
         """
-        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        body = json_dumps_bytes(data)
         self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         self.send_header("Content-Length", str(len(body)))
@@ -460,36 +1041,57 @@ class ProxyHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
-    def _read_body(self) -> bytes:
+    def _read_body(self) -> Optional[bytes]:
         """
         读取请求体（支持 chunked 编码）
         输入: 无（从 self.rfile 读取）
-        输出: 请求体字节
+        输出: 请求体字节，读取超时或出错时返回 None 并发送 408 响应
         """
-        transfer_encoding = self.headers.get("Transfer-Encoding", "")
-        if "chunked" in transfer_encoding.lower():
-            chunks: List[bytes] = []
-            while True:
-                line = self.rfile.readline()
-                if not line:
-                    break
-                size_str = line.split(b";", 1)[0].strip()
-                try:
-                    size = int(size_str, 16)
-                except ValueError:
-                    break
-                if size == 0:
-                    while True:
-                        tail = self.rfile.readline()
-                        if not tail or tail in (b"\r\n", b"\n"):
-                            break
-                    break
-                data = self.rfile.read(size)
-                chunks.append(data)
-                self.rfile.read(2)
-            return b"".join(chunks)
+        self._body_read = True
+        try:
+            transfer_encoding = self.headers.get("Transfer-Encoding", "")
+            if "chunked" in transfer_encoding.lower():
+                return b"".join(iter_chunked_body(self.rfile))
+            length = int(self.headers.get("Content-Length", "0"))
+            return self.rfile.read(length) if length > 0 else b""
+        except OSError as exc:
+            self._send_body_read_error(exc)
+            return None
+
+    def _send_body_read_error(self, exc: OSError) -> None:
+        """
+        读取请求体超时或出错：关闭连接，尚未发送响应时返回 408
+        输入: 读取时的异常
+        输出: 无（直接写入响应）
+        """
+        logging.warning("server: failed to read request body from %s (%s), closing connection",
+                        self.client_address[0], exc)
+        self.close_connection = True
+        try:
+            self.send_response(HTTPStatus.REQUEST_TIMEOUT)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", "27")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(b'{"error":"request_timeout"}')
+        except OSError:
+            pass
+
+    def _read_proxy_body(self, buffer_required: bool) -> Optional[RequestBody]:
+        """
+        读取代理请求体：需要改写请求体时完整读取；否则对大请求体返回流式读取器
+        chunked 请求体仍完整读取，以便向上游发送 Content-Length（部分上游不接受 chunked 上传）
+        输入: 是否必须完整读取
+        输出: bytes 或流式请求体，读取超时或出错时返回 None 并发送 408 响应
+        """
+        if buffer_required or "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return self._read_body()
         length = int(self.headers.get("Content-Length", "0"))
-        return self.rfile.read(length) if length > 0 else b""
+        if length >= STREAM_BODY_MIN_BYTES:
+            self._body_read = True
+            self._body_stream = BodyStream(self.rfile, length)
+            return self._body_stream
+        return self._read_body()
 
     def _serve_static(self, file_path: Path, content_type: str) -> None:
         """
@@ -497,10 +1099,101 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: 文件路径, Content-Type
         输出: 无（直接写入响应）
         """
-        if not file_path.exists():
+        body = load_static_file(file_path)
+        if body is None:
             self.send_error(HTTPStatus.NOT_FOUND, "Not Found")
             return
-        self._send_text(file_path.read_bytes(), content_type)
+        self._send_text(body, content_type)
+
+    def parse_request(self) -> bool:
+        """解析请求行和 headers，同时清空上一个请求的缓存（keep-alive 连接会复用 handler）"""
+        self._cached_client_token: Optional[str] = None
+        self._cached_header_items: Optional[HeaderItems] = None
+        self._cached_request_url: Optional[urllib.parse.SplitResult] = None
+        self._body_read = False
+        self._body_stream: Optional[BodyStream] = None
+        if not super().parse_request():
+            return False
+        # 请求行和 headers 已读完，请求体改用 CLIENT_READ_TIMEOUT：
+        # 工作线程数量固定，不能让迟迟不发送请求体的客户端一直占用
+        self.connection.settimeout(self.server.state.get_client_read_timeout())
+        return True
+
+    def handle(self) -> None:
+        """
+        处理一个连接上的所有请求（HTTP/1.1 keep-alive）
+        请求之间空闲超过 KEEPALIVE_TIMEOUT 秒时静默关闭连接；
+        读取请求行和 headers 同样受 KEEPALIVE_TIMEOUT 限制（parse_request 成功后改为 CLIENT_READ_TIMEOUT），
+        避免建立连接后不发送数据的客户端一直占用工作线程；
+        请求体没有被完整读取时也关闭连接，否则剩余的请求体会被当成下一个请求解析
+        """
+        self.close_connection = True
+        self.connection.settimeout(KEEPALIVE_TIMEOUT)
+        self.handle_one_request()
+        while not self.close_connection and not self._request_body_pending():
+            self.connection.settimeout(KEEPALIVE_TIMEOUT)
+            try:
+                if not self.rfile.peek(1):
+                    return
+            except OSError:
+                return
+            self.handle_one_request()
+
+    def end_headers(self) -> None:
+        """
+        结束响应 headers
+        请求体还没读取就返回响应（如 401、400）时，handle() 会在响应后关闭连接，
+        这里同时告知客户端 Connection: close，避免客户端复用已关闭的连接
+        """
+        if not self.close_connection and self._request_body_pending():
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def _request_body_pending(self) -> bool:
+        """当前请求是否还有未读取的请求体"""
+        if self._body_stream is not None:
+            return self._body_stream.remaining > 0
+        if self._body_read:
+            return False
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return True
+        try:
+            return int(self.headers.get("Content-Length") or 0) > 0
+        except ValueError:
+            return True
+
+    def _request_url(self) -> urllib.parse.SplitResult:
+        """
+        获取拆分后的请求路径（每个请求只解析一次）
+        输入: 无
+        输出: SplitResult（path, query 等）
+        """
+        url = self._cached_request_url
+        if url is None:
+            url = self._cached_request_url = urllib.parse.urlsplit(self.path)
+        return url
+
+    def _header_items(self) -> HeaderItems:
+        """
+        获取带小写 key 的客户端 headers（每个请求只计算一次）
+        输入: 无
+        输出: (原始 key, 小写 key, value) 三元组
+        """
+        items = self._cached_header_items
+        if items is None:
+            items = self._cached_header_items = lower_header_items(self.headers)
+        return items
+
+    def _client_token(self) -> str:
+        """
+        获取客户端 token（每个请求只提取一次）
+        输入: 无
+        输出: token 字符串
+        """
+        token = self._cached_client_token
+        if token is None:
+            token = self._cached_client_token = self._extract_client_token()
+        return token
 
     def _extract_client_token(self) -> str:
         """
@@ -508,17 +1201,18 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: 无（从 self.headers 和 self.path 读取）
         输出: token 字符串
         """
-        header_map = {k.lower(): v for k, v in self.headers.items()}
-        token = header_map.get("x-api-key", "")
+        # self.headers 本身按 key 大小写不敏感查找，无需构建小写字典
+        token = self.headers.get("x-api-key", "")
         if token:
             return token.strip()
-        auth = header_map.get("authorization", "")
-        if auth.lower().startswith("bearer "):
+        auth = self.headers.get("authorization", "")
+        # 只对 7 个字符的前缀做小写比较，不复制整个 header 值
+        if auth[:7].lower() == "bearer ":
             return auth[7:].strip()
-        token = header_map.get("anthropic-auth-token", "")
+        token = self.headers.get("anthropic-auth-token", "")
         if token:
             return token.strip()
-        query = urllib.parse.urlsplit(self.path).query
+        query = self._request_url().query
         if query:
             params = urllib.parse.parse_qs(query)
             for key in ("token", "key", "api_key"):
@@ -533,15 +1227,15 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输出: 是否授权
         """
         state: ProxyState = self.server.state
-        expected = state.get_config("APIKEY", "")
+        expected = state.get_apikey()
         if not expected:
             return True
-        provided = self._extract_client_token()
+        provided = self._client_token()
         if provided == expected:
             return True
         auth = self.headers.get("Authorization", "")
-        if auth.startswith("Basic "):
-            import base64
+        # 认证方案名大小写不敏感，只对前缀做小写比较
+        if auth[:6].lower() == "basic ":
             try:
                 decoded = base64.b64decode(auth[6:]).decode("utf-8")
                 _, password = decoded.split(":", 1)
@@ -551,6 +1245,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
                 pass
         self.send_response(401)
         self.send_header("WWW-Authenticate", 'Basic realm="ccproxy"')
+        self.send_header("Content-Length", "0")
         self.end_headers()
         return False
 
@@ -560,10 +1255,10 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: ProxyState 对象
         输出: 是否授权
         """
-        expected = state.get_config("APIKEY", "")
+        expected = state.get_apikey()
         if not expected:
             return True
-        provided = self._extract_client_token()
+        provided = self._client_token()
         return provided == expected
 
     def do_GET(self) -> None:
@@ -572,65 +1267,71 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: 无（从 self.path 读取）
         输出: 无（直接写入响应）
         """
-        path = urllib.parse.urlsplit(self.path).path
-        if path in ("/", "/app.js", "/styles.css", "/api/state") and not self._ui_authorized():
+        path = self._request_url().path
+        static = STATIC_FILES.get(path)
+        if static is not None:
+            file_path, content_type, requires_auth = static
+            if requires_auth and not self._ui_authorized():
+                return
+            return self._serve_static(file_path, content_type)
+        self._dispatch(self.GET_ROUTES, path)
+
+    def do_POST(self) -> None:
+        """
+        处理 POST 请求
+        输入: 无（从 self.path 读取）
+        输出: 无（直接写入响应）
+        """
+        self._dispatch(self.POST_ROUTES, self._request_url().path)
+
+    def _dispatch(self, routes: Dict[str, Tuple[str, bool]], path: str) -> None:
+        """
+        按路由表分发请求
+        输入: 路由表, 请求路径
+        输出: 无（直接写入响应）
+        """
+        route = routes.get(path)
+        if route is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "Not Found")
             return
-        if path == "/":
-            return self._serve_static(WEB_DIR / "index.html", "text/html; charset=utf-8")
-        if path == "/app.js":
-            return self._serve_static(WEB_DIR / "app.js", "application/javascript; charset=utf-8")
-        if path == "/styles.css":
-            return self._serve_static(WEB_DIR / "styles.css", "text/css; charset=utf-8")
-        if path == "/docs":
-            return self._serve_static(DOCS_DIR / "index.html", "text/html; charset=utf-8")
-        if path == "/api/state":
-            state: ProxyState = self.server.state
+        handler_name, requires_auth = route
+        if requires_auth and not self._ui_authorized():
+            return
+        getattr(self, handler_name)()
+
+    def _handle_state(self) -> None:
+        """
+        处理 /api/state 请求（带 ETag，状态未变化时返回 304，序列化结果按版本号缓存）
+        输入: 无
+        输出: 无（直接写入响应）
+        """
+        state: ProxyState = self.server.state
+
+        def build() -> bytes:
             selected = state.get_selected_provider()
-            payload = {
+            return json_dumps_bytes({
                 "selected_provider": selected.get("name") if selected else "",
                 "providers": state.get_providers(),
                 "selected_override": state.get_provider_override(""),  # 统一的 override
                 "header_overrides": list(state.get_header_overrides().keys()),
                 "request_overrides": list(state.get_request_overrides().keys()),
                 "global_env_models": state.get_config("env-models", {}),
-            }
-            return self._send_json(payload)
-        if path == "/v1/models":
-            return self._handle_models()
-        self.send_error(HTTPStatus.NOT_FOUND, "Not Found")
+            })
 
-    def do_POST(self) -> None:
-        """
-        处理 POST 请求
-        输入: 无（从 self.path 读取）
-        输出: 无（直接写入响应）
-        """
-        path = urllib.parse.urlsplit(self.path).path
-        if path in ("/api/select", "/api/refresh-models", "/api/reload", "/api/reset", "/api/provider-auth", "/api/test-provider", "/api/refresh-and-test", "/api/retest-failed") and not self._ui_authorized():
+        version, body = state.get_cached("api_state", build)
+        etag = f'W/"{version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
             return
-        if path == "/api/select":
-            return self._handle_select()
-        if path == "/api/refresh-models":
-            return self._handle_refresh_models()
-        if path == "/api/reload":
-            return self._handle_reload()
-        if path == "/api/reset":
-            return self._handle_reset()
-        if path == "/api/provider-auth":
-            return self._handle_provider_auth()
-        if path == "/api/test-provider":
-            return self._handle_test_provider()
-        if path == "/api/refresh-and-test":
-            return self._handle_refresh_and_test()
-        if path == "/api/retest-failed":
-            return self._handle_retest_failed()
-        if path == "/v1/messages":
-            return self._proxy_messages()
-        if path == "/v1/chat/completions":
-            return self._proxy_messages()
-        if path == "/v1/responses":
-            return self._proxy_messages()
-        self.send_error(HTTPStatus.NOT_FOUND, "Not Found")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
 
     def _handle_select(self) -> None:
         """
@@ -683,25 +1384,30 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: provider 列表, ProxyState 对象
         输出: 刷新结果列表
         """
-        token_param = state.get_config("TOKEN_PARAM", "token")
+        token_param = state.get_token_param()
         timeout = self._get_timeout_config(state)
 
-        results = []
-        for p in providers:
+        # 并发请求所有 provider，结果按输入顺序返回
+        results: List[Dict[str, Any]] = [{} for _ in providers]
+        futures = {}
+        for idx, p in enumerate(providers):
             provider_name = p.get("name", "")
             if provider_name == "Note":
-                results.append({"provider": provider_name, "updated": False, "error": "skip Note"})
+                results[idx] = {"provider": provider_name, "updated": False, "error": "skip Note"}
                 continue
-
             override = state.get_provider_override(provider_name)
-            models, error = fetch_models(p, token_param, timeout, override)
+            futures[_REFRESH_POOL.submit(fetch_models, p, token_param, timeout, override)] = (idx, provider_name)
+
+        for future in as_completed(futures):
+            idx, provider_name = futures[future]
+            models, error = future.result()
             if models:
                 state.update_provider_models(provider_name, models)
                 logging.info("refresh: provider=%s count=%s", provider_name, len(models))
-                results.append({"provider": provider_name, "updated": True, "count": len(models)})
+                results[idx] = {"provider": provider_name, "updated": True, "count": len(models)}
             else:
                 logging.info("refresh: provider=%s failed error=%s", provider_name, error)
-                results.append({"provider": provider_name, "updated": False, "error": error or "unknown"})
+                results[idx] = {"provider": provider_name, "updated": False, "error": error or "unknown"}
 
         return results
 
@@ -720,7 +1426,8 @@ class ProxyHandler(BaseHTTPRequestHandler):
 
         # 筛选需要刷新的 providers
         if target:
-            refresh_providers = [p for p in providers if p.get("name") == target]
+            target_provider = state.get_provider(target)
+            refresh_providers = [target_provider] if target_provider else []
         else:
             refresh_providers = providers
 
@@ -797,8 +1504,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
         model = data.get("model", "")  # 可选的指定模型
         prompt = data.get("prompt", "hi")
         state: ProxyState = self.server.state
-        providers = state.get_providers()
-        provider = next((p for p in providers if p.get("name") == name), None)
+        provider = state.get_provider(name)
         if not provider:
             return self._send_json({"error": "provider_not_found"}, status=400)
 
@@ -820,28 +1526,22 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输入: provider 列表, 测试提示词, ProxyState 对象, 是否刷新模型列表, 指定测试模型（可选）
         输出: 无（直接更新 state）
         """
-        original_selected = state.get_selected_provider()
-
         # 1. 刷新模型列表（如果需要）
         if refresh_models:
             self._refresh_provider_models(providers, state)
+            # providers 快照是不可变的，刷新后重新读取最新的模型列表
+            names = {p.get("name") for p in providers}
+            providers = [p for p in state.get_providers() if p.get("name") in names]
 
-        # 记录测试结果
-        test_results = []
-
-        # 2. 测试每个 provider
-        for p in providers:
+        def probe_one(p: Dict[str, Any]) -> Dict[str, Any]:
             provider_name = p.get("name", "")
-            if provider_name == "Note":
-                continue
 
             # 获取模型列表
             models = p.get("models", [])
             if not models:
                 logging.warning("test_batch: provider=%s no models available, skipping test", provider_name)
                 state.set_test_result(provider_name, False)
-                test_results.append({"provider": provider_name, "success": False, "error": "no models"})
-                continue
+                return {"provider": provider_name, "success": False, "error": "no models"}
 
             # 选择测试模型：如果指定了 test_model 且在模型列表中，使用指定的；否则使用第一个
             if test_model and test_model in models:
@@ -851,24 +1551,21 @@ class ProxyHandler(BaseHTTPRequestHandler):
 
             logging.info("test_batch: provider=%s using model=%s", provider_name, selected_model)
 
-            # 临时切换到这个 provider
-            state.set_selected_provider(provider_name)
-            test_result = self._test_provider(selected_model, prompt, state)
+            # 直接传入 provider 测试，不切换全局选中的 provider，多个测试可以并发进行
+            test_result = self._test_provider(p, selected_model, prompt, state)
             state.set_test_result(provider_name, test_result.get("success", False))
 
-            # 记录测试结果
-            test_results.append({
+            return {
                 "provider": provider_name,
                 "success": test_result.get("success", False),
                 "elapsed": test_result.get("elapsed", 0),
                 "error": test_result.get("error", "")
-            })
+            }
 
-        # 恢复原来选中的 provider
-        if original_selected:
-            state.set_selected_provider(original_selected.get("name", ""))
+        # 2. 并发测试所有 provider（结果保持输入顺序）
+        test_results = list(_TEST_POOL.map(probe_one, [p for p in providers if p.get("name", "") != "Note"]))
 
-        # 3. 输出测试汇总（按照实际测试顺序）
+        # 3. 输出测试汇总（按照 provider 顺序）
         logging.info("=" * 60)
         logging.info("test_batch: summary")
         success_count = sum(1 for r in test_results if r["success"])
@@ -909,6 +1606,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
             for p in providers:
                 if p.get("name") != "Note":
                     state.set_test_result(p.get("name", ""), False)
+            providers = state.get_providers()
 
             # 2. 筛选出需要测试的 provider（test_result != True）
             test_providers = [p for p in providers
@@ -963,7 +1661,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
         return self._send_json({"status": "started", "message": "Retest failed providers started in background"})
 
     def _forward_to_upstream(self, provider: Dict[str, Any], provider_override: Dict[str, Any],
-                            client_headers: Dict[str, str], client_query: str, client_body: bytes,
+                            client_headers: HeaderItems, client_query: str, client_body: RequestBody,
                             state: ProxyState, test_mode: bool = False) -> requests.Response:
         """
         转发请求到上游 provider（核心逻辑）
@@ -982,43 +1680,32 @@ class ProxyHandler(BaseHTTPRequestHandler):
         if not upstream_url:
             raise ValueError("provider_url_missing")
 
-        # 日志记录
-        parsed_url = urllib.parse.urlsplit(upstream_url)
-        query_dict = dict(urllib.parse.parse_qsl(parsed_url.query))
-        logging.info("forward: provider=%s url=%s", provider_name, parsed_url._replace(query="").geturl())
-        if query_dict:
-            logging.info("forward: url_query_params (total %d):", len(query_dict))
-            for k, v in query_dict.items():
-                safe_v = "***" if k.lower() in ("token", "key", "api_key", "apikey") else v
-                logging.info("  %s: %s", k, safe_v)
+        # 日志记录（INFO 未开启时跳过 URL 解析、排序和格式化）
+        if _ROOT_LOGGER.isEnabledFor(logging.INFO):
+            log_url, log_query = split_url_for_log(upstream_url)
+            logging.info("forward: provider=%s url=%s", provider_name, log_url)
+            # 逐项输出 query 参数、请求体和 headers 只在 DEBUG 级别进行（需要解析请求体并逐字段序列化）
+            if _ROOT_LOGGER.isEnabledFor(logging.DEBUG):
+                if log_query:
+                    logging.debug("forward: url_query_params (total %d):\n%s", len(log_query),
+                                  "\n".join("  %s: %s" % kv for kv in log_query))
 
-        try:
-            req_data = json.loads(body)
-            logging.info("forward: request_body:")
-            for key, value in req_data.items():
-                value_str = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
-                logging.info("  %s: %s", key, value_str)
-        except Exception:
-            req_text = body.decode("utf-8", errors="replace")
-            req_preview = req_text[:200] + "..." if len(req_text) > 200 else req_text
-            logging.info("forward: request_body=%s", req_preview)
+                self._log_request_body(body, proxy_request.get_body_data())
 
-        logging.info("forward: upstream_headers (total %d):", len(headers))
-        for k, v in sorted(headers.items()):
-            logging.info("  %s: %s", k, v)
+                # 认证类 headers 以及自定义 token header（值中包含 provider token）不输出明文
+                token = proxy_request.provider_token
+                logging.debug("forward: upstream_headers (total %d):\n%s", len(headers), "\n".join(
+                    "  %s: %s" % (k, "***" if k.lower() in SENSITIVE_HEADERS or (token and token in v) else v)
+                    for k, v in sorted(headers.items())))
 
         # 测试模式使用更短的超时时间
         if test_mode:
             timeout = (5.0, 30.0)  # 连接超时 5 秒，读取超时 30 秒
         else:
-            timeout_ms = state.get_config("API_TIMEOUT_MS", "600000")
-            try:
-                timeout = (10.0, float(timeout_ms) / 1000.0)
-            except (TypeError, ValueError):
-                timeout = (10.0, 600.0)
+            timeout = (10.0, state.get_api_timeout(600.0))
 
         try:
-            resp = requests.post(upstream_url, headers=headers, data=body, stream=True, timeout=timeout)
+            resp = _UPSTREAM_SESSION.post(upstream_url, headers=headers, data=body, stream=True, timeout=timeout)
             elapsed = time.time() - start_time
             logging.info("forward: provider=%s status=%s elapsed=%.1fs", provider_name, resp.status_code, elapsed)
             return resp
@@ -1027,6 +1714,25 @@ class ProxyHandler(BaseHTTPRequestHandler):
             logging.error("forward: provider=%s error=%s elapsed=%.1fs", provider_name, exc, elapsed)
             raise
 
+    def _log_request_body(self, body: RequestBody, req_data: Any) -> None:
+        """
+        记录上游请求体到 DEBUG 日志（流式请求体只记录大小，不读取内容）
+        输入: 请求体, 已解析的请求体（ProxyRequest 解析结果，避免重复解析）
+        输出: 无（直接记录日志）
+        """
+        if not isinstance(body, bytes):
+            logging.debug("forward: request_body=(streamed, %d bytes)", len(body))
+            return
+        if isinstance(req_data, dict):
+            logging.debug("forward: request_body:\n%s", "\n".join(
+                "  %s: %s" % (key, json_dumps_text(value))
+                for key, value in req_data.items()))
+        else:
+            # 只解码预览需要的前缀（200 个字符最多 800 字节）
+            req_text = body[:800].decode("utf-8", errors="replace")
+            req_preview = req_text[:200] + "..." if len(req_text) > 200 or len(body) > 800 else req_text
+            logging.debug("forward: request_body=%s", req_preview)
+
     def _stream_response(self, resp: requests.Response, provider_name: str, start_time: float, state: ProxyState) -> None:
         """
         流式返回响应到客户端（包含错误处理和日志记录）
@@ -1034,148 +1740,188 @@ class ProxyHandler(BaseHTTPRequestHandler):
         输出: 无（直接写入响应）
         """
         # 检查错误
+        # 错误响应体先完整读出（原始字节，用于转发），日志预览时再尝试解压
+        error_raw: Optional[bytes] = None
         if resp.status_code != 200:
             error_count = state.increment_error_count(provider_name)
             threshold = state.get_error_threshold()
-            logging.error("=" * 60)
-            logging.error("proxy: ERROR DETECTED")
-            logging.error("  provider: %s", provider_name)
-            logging.error("  status_code: %d", resp.status_code)
-            logging.error("  error_count: %d/%d", error_count, threshold)
-            logging.error("  elapsed: %.1fs", time.time() - start_time)
             try:
-                error_body = resp.content[:1000].decode("utf-8", errors="replace")
-                logging.error("  response_preview: %s", error_body)
+                error_raw = resp.raw.read()
+                preview = error_raw
+                if resp.headers.get("Content-Encoding", "").lower() == "gzip":
+                    preview = gzip.decompress(error_raw)
+                error_body = preview[:1000].decode("utf-8", errors="replace")
             except Exception:
-                logging.error("  response_preview: (unable to read)")
-            logging.error("=" * 60)
+                error_body = "(unable to read)"
+            logging.error("%s\nproxy: ERROR DETECTED\n  provider: %s\n  status_code: %d\n  error_count: %d/%d"
+                          "\n  elapsed: %.1fs\n  response_preview: %s\n%s",
+                          "=" * 60, provider_name, resp.status_code, error_count, threshold,
+                          time.time() - start_time, error_body, "=" * 60)
             if error_count < threshold:
                 logging.warning("proxy: provider=%s dropping connection to trigger client retry", provider_name)
+                self.close_connection = True
                 return
         else:
             state.reset_error_count(provider_name)
 
+        # 慢客户端：单次写入超过该时间仍未被读走则放弃转发，及时释放工作线程和上游连接
+        self.connection.settimeout(state.get_client_write_timeout())
         self.send_response(resp.status_code)
         for key, value in resp.headers.items():
             if key.lower() in HOP_HEADERS:
                 continue
             self.send_header(key, value)
+        # 响应体长度：定长响应转发 Content-Length；流式响应对 HTTP/1.1 客户端使用 chunked 编码（保持 keep-alive），
+        # HTTP/1.0 客户端则在响应结束后关闭连接
+        content_length = str(len(error_raw)) if error_raw is not None else resp.headers.get("Content-Length")
+        chunked = False
+        if content_length is not None:
+            self.send_header("Content-Length", content_length)
+        elif self.request_version != "HTTP/1.0":
+            chunked = True
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Connection", "close")
         self.end_headers()
 
+        # 仅在需要记录响应体（LOG_RESPONSE_BODY 且 DEBUG 日志）时才保留数据块，否则边读边写、不做额外拷贝
+        capture = state.log_response_body() and _ROOT_LOGGER.isEnabledFor(logging.DEBUG)
+        content_encoding = resp.headers.get("Content-Encoding", "").lower()
+        # 未压缩的 SSE 响应边到达边解析，不缓存响应体
+        sse_parser = None
+        if capture and not content_encoding and resp.headers.get("Content-Type", "").startswith("text/event-stream"):
+            sse_parser = SSELogParser("proxy")
+            capture = False
         total_bytes = 0
-        all_chunks = []
+        # 有界捕获：开头最多 MAX_LOG_CAPTURE_BYTES 字节，之后只保留最后 LOG_CAPTURE_TAIL_BYTES 字节
+        head_buf = bytearray()
+        tail_buf = bytearray()
+        # 使用 resp.raw 读取原始内容（不自动解压），保持透明传输
+        # 定长响应（非流式）读满大缓冲区再转发；流式响应用 read1 有数据即返回，不延迟 SSE 事件
+        raw_read1 = getattr(resp.raw, "read1", None)
+        if resp.headers.get("Content-Length"):
+            raw_read, read_size = resp.raw.read, RESPONSE_BUFFER_SIZE
+        elif raw_read1 is not None:
+            raw_read, read_size = raw_read1, STREAM_CHUNK_SIZE
+        else:
+            # 旧版 urllib3 无 read1：read 会等凑满缓冲区，保持小块读取以免 SSE 事件延迟过久
+            raw_read, read_size = resp.raw.read, 8192
+        # wfile 无缓冲（wbufsize=0），每次 write 即一次 sendall，无需 flush
+        # 不使用 os.splice/sendfile 零拷贝：上游多为 TLS，且 http.client 已缓冲部分响应体、需解析 chunked 编码，
+        # 只能在用户态转发
+        raw_write = self.wfile.write
+        if chunked:
+            def write(data: bytes) -> None:
+                raw_write(b"%x\r\n%b\r\n" % (len(data), data))
+        else:
+            write = raw_write
+        pending = error_raw
+        completed = False
         try:
-            # 使用 resp.raw 读取原始内容（不自动解压），保持透明传输
-            # resp.raw.stream() 返回原始字节流，不会自动解压 gzip
             while True:
-                chunk = resp.raw.read(8192)
+                chunk = pending or raw_read(read_size)
+                pending = None
                 if not chunk:
                     break
-                self.wfile.write(chunk)
-                self.wfile.flush()
+                write(chunk)
                 total_bytes += len(chunk)
-                all_chunks.append(chunk)
+                if sse_parser is not None:
+                    sse_parser.feed(chunk)
+                elif capture:
+                    room = MAX_LOG_CAPTURE_BYTES - len(head_buf)
+                    if room > 0:
+                        head_buf += chunk[:room]
+                    if len(chunk) > room:
+                        tail_buf += chunk[max(room, 0):]
+                        if len(tail_buf) > LOG_CAPTURE_TAIL_BYTES:
+                            del tail_buf[:len(tail_buf) - LOG_CAPTURE_TAIL_BYTES]
+            if chunked:
+                raw_write(b"0\r\n\r\n")
+            completed = True
         except BrokenPipeError:
             logging.warning("proxy: client disconnected (BrokenPipeError)")
+        except socket.timeout:
+            logging.warning("proxy: provider=%s client too slow, write timed out after %.0fs, aborting stream",
+                            provider_name, state.get_client_write_timeout())
         except Exception as e:
             logging.error("proxy: stream error=%s", e)
+        if not completed:
+            # 响应未完整发送，连接不能再复用
+            self.close_connection = True
 
         elapsed = time.time() - start_time
 
+        if sse_parser is not None:
+            sse_parser.close()
+        if not capture:
+            logging.info("proxy: provider=%s completed bytes=%s elapsed=%.1fs", provider_name, total_bytes, elapsed)
+            return
+
         # 显示响应内容（尝试解压以便日志显示）
-        raw_content = b"".join(all_chunks)
-        # 检查是否是 gzip 压缩
-        content_encoding = resp.headers.get("Content-Encoding", "").lower()
-        if content_encoding == "gzip":
+        tail_content = bytes(tail_buf)
+        skipped = total_bytes - len(head_buf) - len(tail_content)
+        if skipped > 0:
+            # 响应过大，只记录开头和结尾部分（压缩内容截断后无法解压，仅记录大小）
+            logging.debug("proxy: response_body truncated (%d bytes, %d bytes omitted)", total_bytes, skipped)
+            if content_encoding == "gzip":
+                logging.debug("proxy: response_body (gzip compressed, %d bytes)", total_bytes)
+            else:
+                self._log_response_content(bytes(head_buf) + b"\n\n...\n\n" + tail_content, "proxy")
+        elif content_encoding == "gzip":
+            raw_content = bytes(head_buf) + tail_content
             try:
-                import gzip
                 decompressed = gzip.decompress(raw_content)
                 self._log_response_content(decompressed, "proxy")
             except Exception:
-                logging.info("proxy: response_body (gzip compressed, %d bytes)", len(raw_content))
+                logging.debug("proxy: response_body (gzip compressed, %d bytes)", len(raw_content))
         else:
-            self._log_response_content(raw_content, "proxy")
+            self._log_response_content(bytes(head_buf) + tail_content, "proxy")
 
         logging.info("proxy: provider=%s completed bytes=%s elapsed=%.1fs", provider_name, total_bytes, elapsed)
 
     def _log_response_content(self, content: bytes, log_prefix: str = "proxy") -> None:
         """
-        记录响应内容到日志（统一的响应内容记录逻辑）
+        记录响应内容到 DEBUG 日志（统一的响应内容记录逻辑）
         输入: 响应内容字节, 日志前缀
         输出: 无（直接记录日志）
         """
+        if not _ROOT_LOGGER.isEnabledFor(logging.DEBUG):
+            return
         try:
-            text = content.decode("utf-8", errors="replace")
             try:
-                resp_data = json.loads(text)
-                logging.info("%s: response_body:", log_prefix)
-                for key, value in resp_data.items():
-                    value_str = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
-                    logging.info("  %s: %s", key, value_str)
-            except json.JSONDecodeError:
-                if text.startswith("event:") or "data:" in text:
-                    logging.info("%s: response_body (SSE stream):", log_prefix)
-                    accumulated_text = []
-                    accumulated_thinking = []
-                    for event in text.split('\n\n'):
-                        if not event.strip():
-                            continue
-                        lines = event.strip().split('\n')
-                        event_type = ""
-                        for line in lines:
-                            if line.startswith("event:"):
-                                event_type = line[6:].strip()
-                            elif line.startswith("data:"):
-                                try:
-                                    data = json.loads(line[5:].strip())
-                                    # Chat Completions 格式
-                                    if "choices" in data:
-                                        content = data.get("choices", [{}])[0].get("delta", {}).get("content")
-                                        if content:
-                                            accumulated_text.append(content)
-                                    # Claude Messages 格式
-                                    else:
-                                        delta_type = data.get("delta", {}).get("type")
-                                        if event_type == "content_block_delta" and delta_type == "text_delta":
-                                            accumulated_text.append(data["delta"]["text"])
-                                        elif event_type == "content_block_delta" and delta_type == "thinking_delta":
-                                            accumulated_thinking.append(data["delta"]["thinking"])
-                                        else:
-                                            if accumulated_text:
-                                                logging.info("  [content_block_delta] accumulated_text:\n%s", "".join(accumulated_text))
-                                                accumulated_text = []
-                                            if accumulated_thinking:
-                                                logging.info("  [content_block_delta] accumulated_thinking:\n%s", "".join(accumulated_thinking))
-                                                accumulated_thinking = []
-                                            data_str = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-                                            logging.info("  [%s] %s", event_type or "data", data_str)
-                                except:
-                                    logging.info("  [%s] %s", event_type or "data", line[5:].strip())
-                    if accumulated_text:
-                        logging.info("  [content_block_delta] accumulated_text:\n%s", "".join(accumulated_text))
-                    if accumulated_thinking:
-                        logging.info("  [content_block_delta] accumulated_thinking:\n%s", "".join(accumulated_thinking))
+                # 直接解析 bytes，JSON 响应无需先整体解码为 str
+                resp_data = json_loads(content)
+                logging.debug("%s: response_body:\n%s", log_prefix, "\n".join(
+                    "  %s: %s" % (key, json_dumps_text(value))
+                    for key, value in resp_data.items()))
+            except ValueError:
+                if content.startswith(b"event:") or b"data:" in content:
+                    parser = SSELogParser(log_prefix)
+                    parser.feed(content)
+                    parser.close()
                 else:
                     preview_len = 500
-                    if len(text) <= preview_len * 2:
-                        preview = text
+                    if len(content) <= preview_len * 8:
+                        text = content.decode("utf-8", errors="replace")
+                        if len(text) <= preview_len * 2:
+                            preview = text
+                        else:
+                            preview = text[:preview_len] + " ... " + text[-preview_len:]
                     else:
-                        preview = text[:preview_len] + " ... " + text[-preview_len:]
+                        # 只解码首尾预览需要的字节（UTF-8 每个字符最多 4 字节），不解码整个响应体
+                        preview = (content[:preview_len * 4].decode("utf-8", errors="replace")[:preview_len] + " ... "
+                                   + content[-preview_len * 4:].decode("utf-8", errors="replace")[-preview_len:])
                     preview = preview.replace("\n", "\\n").replace("\r", "")
-                    logging.info("%s: response_preview=%s", log_prefix, preview)
+                    logging.debug("%s: response_preview=%s", log_prefix, preview)
         except Exception:
             pass
 
-    def _test_provider(self, model: str, prompt: str, state: ProxyState) -> Dict[str, Any]:
+    def _test_provider(self, provider: Dict[str, Any], model: str, prompt: str, state: ProxyState) -> Dict[str, Any]:
         """
-        测试当前选中的 provider
-        输入: 测试模型, 测试提示词, ProxyState 对象
+        测试指定的 provider
+        输入: provider 配置, 测试模型, 测试提示词, ProxyState 对象
         输出: 测试结果字典（包含 success, status, error, elapsed）
         """
-        provider = state.get_selected_provider()
-        if not provider:
-            return {"success": False, "error": "no_provider_selected"}
-
         provider_override = state.get_provider_override(provider.get("name", ""))
         provider_name = provider.get("name", "")
         api_base_url = provider.get("api_base_url", "")
@@ -1187,10 +1933,10 @@ class ProxyHandler(BaseHTTPRequestHandler):
 
         # 1. 构造测试请求 - 根据端点类型选择格式
         provider_token = provider.get("token") or provider.get("api_key") or ""
-        client_headers = {
+        client_headers = lower_header_items({
             "Authorization": provider_token,
             "Content-Type": "application/json"
-        }
+        })
         client_query = ""
 
         # 根据端点类型构造不同格式的请求
@@ -1225,7 +1971,7 @@ class ProxyHandler(BaseHTTPRequestHandler):
                 }]
             }
 
-        client_body = json.dumps(request_data, separators=(',', ':')).encode("utf-8")
+        client_body = json_dumps_bytes(request_data)
 
         # 2. 测试时根据端点类型自动选择覆写配置
         test_override = dict(provider_override)
@@ -1252,15 +1998,16 @@ class ProxyHandler(BaseHTTPRequestHandler):
             # 3. 转发处理（复用核心逻辑，使用测试模式的短超时）
             resp = self._forward_to_upstream(provider, test_override, client_headers, client_query, client_body, state, test_mode=True)
 
-            # 4. 测试模式下只读取部分响应内容用于日志，避免超时
-            try:
-                # 只读取前 2KB 的响应内容
-                partial_content = resp.raw.read(2048)
-                if partial_content:
-                    logging.info("test: provider=%s received response (partial, %d bytes)", provider_name, len(partial_content))
-                    self._log_response_content(partial_content, "test")
-            except Exception as e:
-                logging.info("test: provider=%s received response (unable to read content: %s)", provider_name, str(e))
+            # 4. 测试模式下只读取部分响应内容用于日志，避免超时（读完即关闭连接，不等待剩余内容）
+            with resp:
+                try:
+                    # 只读取前 2KB 的响应内容
+                    partial_content = resp.raw.read(2048)
+                    if partial_content:
+                        logging.info("test: provider=%s received response (partial, %d bytes)", provider_name, len(partial_content))
+                        self._log_response_content(partial_content, "test")
+                except Exception as e:
+                    logging.info("test: provider=%s received response (unable to read content: %s)", provider_name, e)
 
             # 计算响应时间
             elapsed = time.time() - start_time
@@ -1273,8 +2020,9 @@ class ProxyHandler(BaseHTTPRequestHandler):
             return {"success": False, "status": resp.status_code, "error": "see logs", "elapsed": elapsed}
         except Exception as exc:
             elapsed = time.time() - start_time
-            logging.error("test: provider=%s error=%s elapsed=%.1fs", provider_name, str(exc)[:200], elapsed)
-            return {"success": False, "error": str(exc)[:200], "elapsed": elapsed}
+            error_msg = str(exc)[:200]
+            logging.error("test: provider=%s error=%s elapsed=%.1fs", provider_name, error_msg, elapsed)
+            return {"success": False, "error": error_msg, "elapsed": elapsed}
 
     def _proxy_messages(self) -> None:
         """
@@ -1291,13 +2039,17 @@ class ProxyHandler(BaseHTTPRequestHandler):
         provider_override = state.get_provider_override(provider.get("name", ""))
         provider_name = provider.get("name", "")
         start_time = time.time()
-        logging.info("-" * 60)
-        logging.info("proxy: mode=%s provider=%s", "passthrough" if not provider_override.get("token_in") else "override", provider_name)
+        logging.info("%s\nproxy: mode=%s provider=%s", "-" * 60,
+                     "passthrough" if not provider_override.get("token_in") else "override", provider_name)
 
         # 1. 接收客户端请求
-        client_headers = {k: v for k, v in self.headers.items()}
-        client_query = urllib.parse.urlsplit(self.path).query
-        client_body = self._read_body()
+        client_headers = self._header_items()
+        client_query = self._request_url().query
+        # 需要注入字段时必须完整读取请求体，否则大请求体直接流式转发
+        client_body = self._read_proxy_body(
+            buffer_required=bool(ProxyRequest.resolve_inject_fields(provider_override, state)))
+        if client_body is None:
+            return
 
         try:
             # 2. 转发处理（复用核心逻辑）
@@ -1305,10 +2057,62 @@ class ProxyHandler(BaseHTTPRequestHandler):
         except ValueError as exc:
             return self._send_json({"error": str(exc)}, status=502)
         except requests.RequestException as exc:
+            # 流式转发请求体时读取客户端超时，错误在客户端一侧而不是上游
+            if isinstance(client_body, BodyStream) and client_body.error is not None:
+                return self._send_body_read_error(client_body.error)
             return self._send_json({"error": "upstream_error", "detail": str(exc)}, status=502)
 
-        # 3. 流式返回响应（复用响应处理逻辑）
-        self._stream_response(resp, provider_name, start_time, state)
+        # 3. 流式返回响应（复用响应处理逻辑），结束后归还或关闭上游连接
+        with resp:
+            self._stream_response(resp, provider_name, start_time, state)
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    使用固定数量工作线程处理连接的 HTTP 服务器
+    替代 ThreadingHTTPServer 的“每个连接一个新线程”，突发请求时线程数有上限，且不再为每个连接创建线程
+    """
+
+    # listen 队列长度：默认的 5 在突发连接时会被占满，客户端只能等待 SYN 重传（约 1 秒起）
+    request_queue_size = 128
+
+    # 等待队列已满时直接返回的响应（不占用工作线程）
+    BUSY_RESPONSE = (b"HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: 23\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
+                     b'{"error":"server_busy"}')
+
+    def __init__(self, server_address: Tuple[str, int], handler_class: type, pool_size: int,
+                 max_pending: int = 0) -> None:
+        super().__init__(server_address, handler_class)
+        self._requests: "queue.Queue[Tuple[Any, Any]]" = queue.Queue()
+        # 等待工作线程的连接数上限（0 表示不限制），超过时立即返回 503，避免请求长时间排队
+        self._max_pending = max_pending
+        # 使用 daemon 线程：与 ThreadingHTTPServer 一致，退出时不等待仍在进行的流式响应
+        for i in range(pool_size):
+            threading.Thread(target=self._worker, daemon=True, name=f"http_{i}").start()
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        """把已接受的连接交给工作线程处理；等待队列已满时返回 503 并关闭连接"""
+        if self._max_pending and self._requests.qsize() >= self._max_pending:
+            logging.warning("server: busy, rejecting connection from %s (pending=%d)", client_address[0], self._max_pending)
+            try:
+                request.sendall(self.BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self._requests.put((request, client_address))
+
+    def _worker(self) -> None:
+        """工作线程：循环处理队列中的连接（与 ThreadingMixIn.process_request_thread 相同）"""
+        while True:
+            request, client_address = self._requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
@@ -1332,18 +2136,26 @@ def main() -> None:
     config_path = Path(args.config)
     with config_path.open("r", encoding="utf-8-sig") as f:
         config = json.load(f)
-    state = ProxyState(config, config_path)
 
     log_enabled = config.get("LOG", True)
     if log_enabled:
         level_name = str(config.get("LOG_LEVEL", "info")).lower()
         level = logging.INFO if level_name not in ("debug", "info", "warning", "error") else getattr(logging, level_name.upper())
-        logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(message)s")
+        setup_logging(level)
+
+    state = ProxyState(config, config_path)
+    # 退出前写入尚未保存的状态；SIGTERM 转为正常退出，确保 atexit 生效
+    atexit.register(state.flush_state)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     host = config.get("HOST", "127.0.0.1")
     port = int(config.get("PORT", 3456))
 
-    server = ThreadingHTTPServer((host, port), ProxyHandler)
+    # 流式响应会长时间占用工作线程，线程池大小需覆盖并发的流式请求数
+    pool_size = int(config.get("HTTP_POOL_SIZE", max(32, (os.cpu_count() or 1) * 4)))
+    max_pending = int(config.get("HTTP_MAX_PENDING", pool_size * 4))
+
+    server = PooledHTTPServer((host, port), ProxyHandler, pool_size, max_pending)
     server.state = state  # type: ignore[attr-defined]
 
     # 禁用启动时自动刷新模型列表，可通过网页手动刷新
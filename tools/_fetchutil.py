@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+tools 下各模型列表脚本共用的获取逻辑
+提供共享 Session、OpenAI SDK 回退、按 (base_url, api_key) 去重的获取和错误标记
+"""
+
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future
+
+try:
+    import orjson  # 可选依赖：解析 /v1/models 响应提速，未安装时回退到标准库 json
+except ImportError:
+    orjson = None
+
+# 解析 bytes 形式的 JSON 响应体
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# 并发获取模型列表的默认最大线程数（可用 --workers 调整，实际线程数不超过 provider 数量）
+MAX_WORKERS = 64
+
+# 所有线程共享一个 Session：同一 host 的多个 provider 复用 TCP/TLS 连接
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+_SESSION.mount('https://', HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+
+# OpenAI SDK 回退路径共享的 HTTP 客户端（首次回退时创建；每个 provider 的 api_key 不同，只共享底层连接）
+_openai_http_client = None
+_openai_http_client_lock = threading.Lock()
+
+
+def _new_openai_client(base_url, api_key, timeout):
+    """
+    创建 OpenAI SDK 客户端（仅在 requests 获取失败时调用）
+    openai 会连带导入 pydantic/httpx 等，延迟到真正需要时再导入，正常路径不承担这部分启动开销
+    """
+    global _openai_http_client
+    from openai import OpenAI, DefaultHttpxClient
+
+    with _openai_http_client_lock:
+        if _openai_http_client is None:
+            _openai_http_client = DefaultHttpxClient()
+    return OpenAI(
+        base_url=f"{base_url}/v1",
+        api_key=api_key,
+        timeout=timeout,
+        http_client=_openai_http_client
+    )
+
+
+# 错误信息关键词 -> 模型列表前的错误标记（按顺序匹配，第一个命中的生效）
+_ERROR_TAGS = (
+    (('html',), '[错误:HTML响应]'),
+    (('timed out', 'timeout'), '[错误:超时]'),
+    (('blocked',), '[错误:被拦截]'),
+    (('401', '认证', '令牌'), '[错误:认证失败]'),
+    (('402',), '[错误:余额不足]'),
+)
+
+
+def error_tag_for(error_msg):
+    """根据错误信息返回简化的错误标记（只做一次 lower()）"""
+    msg_lower = error_msg.lower()
+    for needles, tag in _ERROR_TAGS:
+        if any(n in msg_lower for n in needles):
+            return tag
+    return '[错误:获取失败]'
+
+
+def get_models_from_provider(base_url, api_key, timeout=30.0):
+    """
+    先用 requests 获取模型列表，失败或为空时用 OpenAI SDK 重试
+    """
+    start_time = time.time()
+
+    # 先尝试 requests
+    requests_error = None
+    try:
+        headers = {'Authorization': f'Bearer {api_key}'}
+        r = _SESSION.get(f"{base_url}/v1/models", headers=headers, timeout=timeout)
+        r.raise_for_status()
+        data = _json_loads(r.content)
+        models = [m['id'] for m in data.get('data', [])]
+        if models:
+            return models, None, time.time() - start_time
+    except Exception as e:
+        requests_error = e
+
+    # requests 失败或为空，用 OpenAI SDK 重试
+    try:
+        client = _new_openai_client(base_url, api_key, timeout)
+        models_response = client.models.list()
+        models = [model.id for model in models_response.data]
+        return models, None, time.time() - start_time
+    except Exception as e:
+        if isinstance(e, ImportError):
+            # 未安装 openai 时无法重试，报告 requests 的真实错误（而不是 No module named 'openai'）
+            if requests_error is None:
+                return [], None, time.time() - start_time
+            e = requests_error
+        error_msg = str(e)
+        if '<html' in error_msg.lower() or '<!doctype' in error_msg.lower():
+            error_msg = "API 返回 HTML 错误页面(可能是认证失败或 URL 错误)"
+        elif len(error_msg) > 200:
+            error_msg = error_msg[:200] + "..."
+        return None, error_msg, 0
+
+
+# 同一 (base_url, api_key) 只请求一次：首个线程负责获取，重复的 provider 等待并复用其结果
+_fetch_results = {}
+_fetch_results_lock = threading.Lock()
+
+
+def get_models_once(base_url, api_key, timeout):
+    """按 (base_url, api_key) 去重的 get_models_from_provider"""
+    key = (base_url, api_key)
+    with _fetch_results_lock:
+        future = _fetch_results.get(key)
+        owner = future is None
+        if owner:
+            future = _fetch_results[key] = Future()
+    if owner:
+        future.set_result(get_models_from_provider(base_url, api_key, timeout))
+    return future.result()
+
+
+def last_fetch_failed(provider):
+    """模型列表以错误标记开头，说明上次获取失败"""
+    models = provider.get('models')
+    return bool(models) and str(models[0]).startswith('[错误:')
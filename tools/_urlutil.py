@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+tools 下各转换脚本共用的 URL 工具函数
+脚本以 python tools/xxx.py 方式运行时，脚本所在目录位于 sys.path 首位，可直接 from _urlutil import ...
+"""
+
+# API 路径后缀（extract_base_url 按顺序检查，更具体的格式在前）
+_API_PATH_SUFFIXES = ("/anthropic/v1/messages", "/v1/chat/completions", "/v1/messages")
+
+
+def extract_base_url(api_base_url):
+    """
+    从 api_base_url 中提取基础 URL
+    支持多种格式:
+    - Claude 格式: https://api.example.com/v1/messages -> https://api.example.com
+    - OpenAI 格式: https://api.example.com/v1/chat/completions -> https://api.example.com
+    - Anthropic 格式: https://api.example.com/anthropic/v1/messages -> https://api.example.com
+    """
+    # 按优先级检查（正则交替会取最左匹配而不是优先级最高的格式），都不匹配时返回原始 URL
+    for suffix in _API_PATH_SUFFIXES:
+        if suffix in api_base_url:
+            return api_base_url.replace(suffix, "")
+    return api_base_url
@@ -6,76 +6,23 @@
 用法: python ccp2ccr.py [--input config.json] [--output cc-router.json] [--timeout 30] [--filter "4-5,sonnet"]
 """
 
+import heapq
 import json
+import os
+import re
 import sys
 import argparse
-import requests
-from openai import OpenAI
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from _urlutil import extract_base_url
+from _fetchutil import MAX_WORKERS, error_tag_for, get_models_once, last_fetch_failed
+
 # 设置输出编码为 UTF-8
 if sys.platform == 'win32':
     import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 
-def extract_base_url(api_base_url):
-    """
-    从 api_base_url 中提取基础 URL
-    支持多种格式:
-    - Claude 格式: https://api.example.com/v1/messages -> https://api.example.com
-    - OpenAI 格式: https://api.example.com/v1/chat/completions -> https://api.example.com
-    - Anthropic 格式: https://api.example.com/anthropic/v1/messages -> https://api.example.com
-    """
-    # 优先检查更具体的格式
-    if "/anthropic/v1/messages" in api_base_url:
-        return api_base_url.replace("/anthropic/v1/messages", "")
-    elif "/v1/chat/completions" in api_base_url:
-        return api_base_url.replace("/v1/chat/completions", "")
-    elif "/v1/messages" in api_base_url:
-        return api_base_url.replace("/v1/messages", "")
-    # 如果都不匹配，返回原始 URL
-    return api_base_url
-
-
-def get_models_from_provider(base_url, api_key, timeout=30.0):
-    """
-    先用 requests 获取模型列表，失败或为空时用 OpenAI SDK 重试
-    """
-    import time
-    start_time = time.time()
-
-    # 先尝试 requests
-    try:
-        headers = {'Authorization': f'Bearer {api_key}'}
-        r = requests.get(f"{base_url}/v1/models", headers=headers, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        models = [m['id'] for m in data.get('data', [])]
-        if models:
-            return models, None, time.time() - start_time
-    except Exception:
-        pass
-
-    # requests 失败或为空，用 OpenAI SDK 重试
-    try:
-        client = OpenAI(
-            base_url=f"{base_url}/v1",
-            api_key=api_key,
-            timeout=timeout
-        )
-        models_response = client.models.list()
-        models = [model.id for model in models_response.data]
-        return models, None, time.time() - start_time
-    except Exception as e:
-        error_msg = str(e)
-        if '<html' in error_msg.lower() or '<!doctype' in error_msg.lower():
-            error_msg = "API 返回 HTML 错误页面(可能是认证失败或 URL 错误)"
-        elif len(error_msg) > 200:
-            error_msg = error_msg[:200] + "..."
-        return None, error_msg, 0
-
-
 def process_provider(idx, total, provider, timeout, update_models):
     """处理单个提供商"""
     name = provider['name']
@@ -91,7 +38,7 @@ def process_provider(idx, total, provider, timeout, update_models):
 
     # 如果需要更新模型列表
     if update_models:
-        models, error, elapsed = get_models_from_provider(base_url, api_key, timeout)
+        models, error, elapsed = get_models_once(base_url, api_key, timeout)
 
         if models is not None:
             if len(models) > 0:
@@ -102,18 +49,7 @@ def process_provider(idx, total, provider, timeout, update_models):
             # 失败时在模型列表前面添加错误标记
             error_msg = error or '未知错误'
             # 简化错误信息
-            if 'HTML' in error_msg:
-                error_tag = '[错误:HTML响应]'
-            elif 'timed out' in error_msg or 'timeout' in error_msg.lower():
-                error_tag = '[错误:超时]'
-            elif 'blocked' in error_msg.lower():
-                error_tag = '[错误:被拦截]'
-            elif '401' in error_msg or '认证' in error_msg or '令牌' in error_msg:
-                error_tag = '[错误:认证失败]'
-            elif '402' in error_msg:
-                error_tag = '[错误:余额不足]'
-            else:
-                error_tag = '[错误:获取失败]'
+            error_tag = error_tag_for(error_msg)
 
             old_models = provider.get('models', [])
             provider['models'] = [error_tag] + old_models
@@ -168,6 +104,13 @@ def main():
                         type=str,
                         default='',
                         help='模型筛选关键词，逗号分隔，如 "4-5,sonnet"')
+    parser.add_argument('--workers', '-w',
+                        type=int,
+                        default=MAX_WORKERS,
+                        help=f'并发获取模型列表的最大线程数，默认 {MAX_WORKERS}')
+    parser.add_argument('--skip-failed',
+                        action='store_true',
+                        help='跳过上次获取失败(模型列表以 [错误:...] 开头)的提供商')
 
     args = parser.parse_args()
 
@@ -189,37 +132,50 @@ def main():
     if args.update_models:
         print(f"共有 {total} 个提供商需要更新(超时: {args.timeout}s)\n")
 
-        # 并发处理所有提供商
+        # 并发处理所有提供商（Note 不需要请求，提交前就跳过，不占用线程池任务）
+        tasks = [(idx, provider) for idx, provider in enumerate(providers, 1) if provider.get('name') != 'Note']
+        if args.skip_failed:
+            for idx, provider in tasks:
+                if last_fetch_failed(provider):
+                    print(f"[{idx}/{total}] [SKIP] {provider['name']}: 上次获取失败，已跳过")
+            tasks = [(idx, provider) for idx, provider in tasks if not last_fetch_failed(provider)]
         results = []
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(tasks)))) as executor:
             futures = [
                 executor.submit(process_provider, idx, total, provider, args.timeout, True)
-                for idx, provider in enumerate(providers, 1)
+                for idx, provider in tasks
             ]
 
-            for future in as_completed(futures):
+            # 每完成一个就刷新进度，避免等待最慢的 provider 超时期间没有任何输出
+            for done, _ in enumerate(as_completed(futures), 1):
+                print(f"\r已完成 {done}/{len(futures)}", end='', flush=True)
+            print("\n")
+
+            # 按提交顺序（即 provider 顺序）收集结果，输出时无需再排序
+            for future in futures:
                 try:
                     results.append(future.result())
                 except Exception:
                     pass
 
         # 找出最快的三个成功的 provider
-        success_results = [(idx, name, count, elapsed) for idx, name, count, error, elapsed, url in results if not error and name != 'Note']
-        success_results.sort(key=lambda x: x[3])  # 按时间排序
-        fastest_names = {name for _, name, _, _ in success_results[:3]}
+        fastest = heapq.nsmallest(3, ((name, elapsed) for idx, name, count, error, elapsed, url in results if not error and name != 'Note'), key=lambda x: x[1])
+        fastest_names = {name for name, _ in fastest}
 
-        # 按索引排序并输出结果
-        results.sort(key=lambda x: x[0])
+        # 输出结果（先拼好所有行，一次写出）
+        lines = []
         for idx, name, count, error, elapsed, url in results:
             if name == 'Note':
                 continue
             if error:
-                print(f"[{idx}/{total}] [FAIL] {name}: {error}")
-                print(f"           URL: {url}")
+                lines.append(f"[{idx}/{total}] [FAIL] {name}: {error}")
+                lines.append(f"           URL: {url}")
             else:
                 slow_mark = " [SLOW]" if elapsed > 15 else ""
                 fast_mark = " ***" if name in fastest_names else ""
-                print(f"[{idx}/{total}] [OK] {name}: {count} 个模型 ({elapsed:.1f}s){slow_mark}{fast_mark}")
+                lines.append(f"[{idx}/{total}] [OK] {name}: {count} 个模型 ({elapsed:.1f}s){slow_mark}{fast_mark}")
+        if lines:
+            print('\n'.join(lines))
     else:
         print(f"正在转换配置(不更新模型列表)...")
         # 不更新模型，直接处理
@@ -229,12 +185,14 @@ def main():
     # 筛选模型
     if args.filter:
         keywords = [k.strip().lower() for k in args.filter.split(',') if k.strip()]
+        # 所有关键词合并为一个忽略大小写的正则，每个模型名只扫描一次
+        keyword_pattern = re.compile('|'.join(re.escape(k) for k in keywords), re.IGNORECASE)
         print(f"\n筛选模型关键词: {', '.join(keywords)}")
         for p in providers:
             if p.get('name') == 'Note':
                 continue
             models = p.get('models', [])
-            filtered = [m for m in models if any(k in m.lower() for k in keywords)]
+            filtered = [m for m in models if keyword_pattern.search(m)]
             if filtered:
                 p['models'] = filtered
 
@@ -256,9 +214,11 @@ def main():
             "image": ""
         }
 
-    # 保存到输出文件
-    with open(args.output, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+    # 保存到输出文件（先写临时文件再替换，写入中断时保留原文件）
+    tmp_path = args.output + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(config, indent=2, ensure_ascii=False))
+    os.replace(tmp_path, args.output)
 
     print("\n" + "=" * 60)
     print(f"✓ 转换完成！结果已保存到 {args.output}")
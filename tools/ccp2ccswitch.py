@@ -6,34 +6,37 @@
 """
 
 import json
+import re
 import sys
 import argparse
 from datetime import datetime
 from urllib.parse import urlparse
 
+from _urlutil import extract_base_url
+
+try:
+    import orjson  # 可选依赖：逐个 provider 的紧凑 JSON 序列化提速，未安装时回退到标准库 json
+except ImportError:
+    orjson = None
+
 # 设置输出编码为 UTF-8
 if sys.platform == 'win32':
     import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# providers 表的列（INSERT 语句使用）
+PROVIDER_COLUMNS = '("id", "app_type", "name", "settings_config", "website_url", "category", "created_at", "sort_index", "notes", "icon", "icon_color", "meta", "is_current")'
 
-def extract_base_url(api_base_url):
-    """
-    从 api_base_url 中提取基础 URL
-    支持多种格式:
-    - Claude 格式: https://api.example.com/v1/messages -> https://api.example.com
-    - OpenAI 格式: https://api.example.com/v1/chat/completions -> https://api.example.com
-    - Anthropic 格式: https://api.example.com/anthropic/v1/messages -> https://api.example.com
-    """
-    # 优先检查更具体的格式
-    if "/anthropic/v1/messages" in api_base_url:
-        return api_base_url.replace("/anthropic/v1/messages", "")
-    elif "/v1/chat/completions" in api_base_url:
-        return api_base_url.replace("/v1/chat/completions", "")
-    elif "/v1/messages" in api_base_url:
-        return api_base_url.replace("/v1/messages", "")
-    # 如果都不匹配，返回原始 URL
-    return api_base_url
+# sanitize_id 使用的正则（模块加载时编译一次）
+_NON_ID_CHARS = re.compile(r'[^a-zA-Z0-9_-]')
+_REPEATED_UNDERSCORES = re.compile(r'_+')
+
+
+def json_dumps_compact(data):
+    """紧凑 JSON 序列化为 str（无空格，非 ASCII 字符不转义）"""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
 
 
 def sanitize_id(name):
@@ -42,10 +45,9 @@ def sanitize_id(name):
     例如: "runanytime.hxi.me" -> "runanytime_hxi_me"
     """
     # 替换特殊字符为下划线
-    import re
-    sanitized = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
+    sanitized = _NON_ID_CHARS.sub('_', name)
     # 移除连续的下划线
-    sanitized = re.sub(r'_+', '_', sanitized)
+    sanitized = _REPEATED_UNDERSCORES.sub('_', sanitized)
     # 移除首尾的下划线
     sanitized = sanitized.strip('_')
     return sanitized.lower()
@@ -58,9 +60,9 @@ def escape_sql_string(s):
     return str(s).replace("'", "''")
 
 
-def provider_to_sql(provider, is_current=False, index=None, add_prefix=False, global_env_models=None):
+def provider_to_values(provider, is_current=False, index=None, add_prefix=False, global_env_models=None):
     """
-    将单个 provider 转换为 SQL INSERT 语句
+    将单个 provider 转换为 INSERT 语句中的一行 VALUES
 
     Args:
         provider: ccproxy 的 provider 对象
@@ -70,7 +72,7 @@ def provider_to_sql(provider, is_current=False, index=None, add_prefix=False, gl
         global_env_models: 全局的 env-models 配置（可以被 provider 级别的配置覆盖）
 
     Returns:
-        SQL INSERT 语句字符串
+        VALUES 行字符串，形如 ('id', 'claude', ...)
     """
     # 提取字段
     name = provider.get('name', 'Unknown')
@@ -92,36 +94,23 @@ def provider_to_sql(provider, is_current=False, index=None, add_prefix=False, gl
     # 提取网站 URL
     # 1. 优先使用 provider 中的 website_url 字段
     # 2. 如果不存在，则从 api_base_url 中提取 https://domain/ 部分
-    if 'website_url' in provider and provider['website_url']:
-        website_url = provider['website_url']
-    else:
-        # 从 base_url 提取 https://domain/
-        parts = base_url.split('/')
-        if len(parts) >= 3:
-            website_url = f"{parts[0]}//{parts[2]}"
-        else:
-            website_url = base_url
+    website_url = provider.get('website_url')
+    if not website_url:
+        # 从 base_url 提取 scheme://netloc（一次 urlparse，保留端口）；无 scheme 时原样使用
+        parsed = urlparse(base_url)
+        website_url = f"{parsed.scheme}://{parsed.netloc}" if parsed.scheme and parsed.netloc else base_url
 
     # 构建 settings_config JSON（简化版，只保留必要信息）
+    # env-models 直接展开合并进 env，优先级：provider 级别的 env-models > 全局 env-models
     settings_config = {
         "env": {
             "ANTHROPIC_AUTH_TOKEN": api_key,
-            "ANTHROPIC_BASE_URL": base_url
+            "ANTHROPIC_BASE_URL": base_url,
+            **(global_env_models or {}),
+            **(provider.get('env-models') or {})
         }
     }
 
-    # 合并 env-models 配置
-    # 优先级：provider 级别的 env-models > 全局 env-models
-    env_models = {}
-    if global_env_models:
-        env_models.update(global_env_models)
-    if 'env-models' in provider and provider['env-models']:
-        env_models.update(provider['env-models'])
-
-    # 将 env-models 添加到 settings_config.env
-    if env_models:
-        settings_config['env'].update(env_models)
-
     # 如果有模型列表，添加到 meta 中
     meta = {}
     if models:
@@ -129,17 +118,14 @@ def provider_to_sql(provider, is_current=False, index=None, add_prefix=False, gl
 
     # 转义字符串（使用紧凑 JSON 格式，无空格）
     name_escaped = escape_sql_string(name)
-    settings_config_json = json.dumps(settings_config, ensure_ascii=False, separators=(',', ':'))
+    settings_config_json = json_dumps_compact(settings_config)
     settings_config_escaped = escape_sql_string(settings_config_json)
     website_url_escaped = escape_sql_string(website_url)
     comment_escaped = escape_sql_string(comment)
-    meta_json = json.dumps(meta, ensure_ascii=False, separators=(',', ':'))
+    meta_json = json_dumps_compact(meta)
     meta_escaped = escape_sql_string(meta_json)
 
-    # 生成 SQL
-    sql = f"""INSERT INTO "providers" ("id", "app_type", "name", "settings_config", "website_url", "category", "created_at", "sort_index", "notes", "icon", "icon_color", "meta", "is_current") VALUES ('{provider_id}', 'claude', '{name_escaped}', '{settings_config_escaped}', '{website_url_escaped}', 'custom', NULL, NULL, '{comment_escaped}', NULL, NULL, '{meta_escaped}', {1 if is_current else 0});"""
-
-    return sql
+    return f"""('{provider_id}', 'claude', '{name_escaped}', '{settings_config_escaped}', '{website_url_escaped}', 'custom', NULL, NULL, '{comment_escaped}', NULL, NULL, '{meta_escaped}', {1 if is_current else 0})"""
 
 
 def export_claudecode_config(provider, output_file, global_env_models=None):
@@ -158,62 +144,30 @@ def export_claudecode_config(provider, output_file, global_env_models=None):
     api_key = provider.get('api_key', '')
     base_url = extract_base_url(api_base_url)
 
-    # 构建配置
+    # 构建配置（env-models 直接展开合并进 env）
     config = {
         "env": {
             "ANTHROPIC_AUTH_TOKEN": api_key,
-            "ANTHROPIC_BASE_URL": base_url
+            "ANTHROPIC_BASE_URL": base_url,
+            **(global_env_models or {}),
+            **(provider.get('env-models') or {})
         },
         "includeCoAuthoredBy": False
     }
 
-    # 合并 env-models 配置
-    env_models = {}
-    if global_env_models:
-        env_models.update(global_env_models)
-    if 'env-models' in provider and provider['env-models']:
-        env_models.update(provider['env-models'])
-
-    # 将 env-models 添加到配置
-    if env_models:
-        config['env'].update(env_models)
-
     # 写入文件
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+        f.write(json.dumps(config, ensure_ascii=False, indent=2))
 
     return config
 
 
-def generate_sql_file(config, output_file, current_provider=None, add_prefix=False):
-    """
-    生成完整的 SQL 文件
+# 表结构及清空 providers 的固定 SQL（模块加载时构建一次，生成时整段写入）
+_SCHEMA_SQL = """PRAGMA foreign_keys=OFF;
+BEGIN TRANSACTION;
 
-    Args:
-        config: ccproxy 配置对象
-        output_file: 输出文件路径
-        current_provider: 当前激活的 provider 名称（默认为第一个非 Note 的）
-        add_prefix: 是否在名称前添加序号前缀（01-, 02-, ...）
-    """
-    providers = config.get('Providers', [])
-    global_env_models = config.get('env-models', None)
-
-    # 如果没有指定 current_provider，使用第一个 provider
-    if current_provider is None and len(providers) > 0:
-        current_provider = providers[0].get('name')
-
-    # 生成 SQL 头部(包含表结构和数据)
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    sql_lines = [
-        "-- CC Switch SQLite 导出",
-        f"-- 生成时间: {now}",
-        "-- 由 ccp2ccswitch.py 自动生成",
-        "",
-        "PRAGMA foreign_keys=OFF;",
-        "BEGIN TRANSACTION;",
-        "",
-        "-- 创建表结构(如果不存在)",
-        """CREATE TABLE IF NOT EXISTS mcp_servers (
+-- 创建表结构(如果不存在)
+CREATE TABLE IF NOT EXISTS mcp_servers (
                 id TEXT PRIMARY KEY,
                 name TEXT NOT NULL,
                 server_config TEXT NOT NULL,
@@ -224,9 +178,9 @@ def generate_sql_file(config, output_file, current_provider=None, add_prefix=Fal
                 enabled_claude BOOLEAN NOT NULL DEFAULT 0,
                 enabled_codex BOOLEAN NOT NULL DEFAULT 0,
                 enabled_gemini BOOLEAN NOT NULL DEFAULT 0
-            );""",
-        "",
-        """CREATE TABLE IF NOT EXISTS prompts (
+            );
+
+CREATE TABLE IF NOT EXISTS prompts (
                 id TEXT NOT NULL,
                 app_type TEXT NOT NULL,
                 name TEXT NOT NULL,
@@ -236,18 +190,18 @@ def generate_sql_file(config, output_file, current_provider=None, add_prefix=Fal
                 created_at INTEGER,
                 updated_at INTEGER,
                 PRIMARY KEY (id, app_type)
-            );""",
-        "",
-        """CREATE TABLE IF NOT EXISTS provider_endpoints (
+            );
+
+CREATE TABLE IF NOT EXISTS provider_endpoints (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 provider_id TEXT NOT NULL,
                 app_type TEXT NOT NULL,
                 url TEXT NOT NULL,
                 added_at INTEGER,
                 FOREIGN KEY (provider_id, app_type) REFERENCES providers(id, app_type) ON DELETE CASCADE
-            );""",
-        "",
-        """CREATE TABLE IF NOT EXISTS providers (
+            );
+
+CREATE TABLE IF NOT EXISTS providers (
                 id TEXT NOT NULL,
                 app_type TEXT NOT NULL,
                 name TEXT NOT NULL,
@@ -262,48 +216,61 @@ def generate_sql_file(config, output_file, current_provider=None, add_prefix=Fal
                 meta TEXT NOT NULL DEFAULT '{}',
                 is_current BOOLEAN NOT NULL DEFAULT 0,
                 PRIMARY KEY (id, app_type)
-            );""",
-        "",
-        """CREATE TABLE IF NOT EXISTS settings (
+            );
+
+CREATE TABLE IF NOT EXISTS settings (
                 key TEXT PRIMARY KEY,
                 value TEXT
-            );""",
-        "",
-        """CREATE TABLE IF NOT EXISTS skill_repos (
+            );
+
+CREATE TABLE IF NOT EXISTS skill_repos (
                 owner TEXT NOT NULL,
                 name TEXT NOT NULL,
                 branch TEXT NOT NULL DEFAULT 'main',
                 enabled BOOLEAN NOT NULL DEFAULT 1,
                 PRIMARY KEY (owner, name)
-            );""",
-        "",
-        """CREATE TABLE IF NOT EXISTS skills (
+            );
+
+CREATE TABLE IF NOT EXISTS skills (
                 key TEXT PRIMARY KEY,
                 installed BOOLEAN NOT NULL DEFAULT 0,
                 installed_at INTEGER NOT NULL DEFAULT 0
-            );""",
-        "",
-        "-- 清空 providers 表(避免主键冲突)",
-        "DELETE FROM providers;",
-        "",
-        "-- 插入 providers 数据",
-    ]
+            );
 
-    # 转换每个 provider
-    index = 1
-    for provider in providers:
-        is_current = (provider.get('name') == current_provider)
-        sql = provider_to_sql(provider, is_current, index, add_prefix, global_env_models)
-        sql_lines.append(sql)
-        index += 1
+-- 清空 providers 表(避免主键冲突)
+DELETE FROM providers;
 
-    # 不再添加 skill_repos(用户可能已有配置)
+-- 插入 providers 数据
+"""
 
-    # SQL 尾部
-    sql_lines.extend([
+
+def generate_sql_file(config, output_file, current_provider=None, add_prefix=False):
+    """
+    生成完整的 SQL 文件
+
+    Args:
+        config: ccproxy 配置对象
+        output_file: 输出文件路径
+        current_provider: 当前激活的 provider 名称（默认为第一个非 Note 的）
+        add_prefix: 是否在名称前添加序号前缀（01-, 02-, ...）
+    """
+    providers = config.get('Providers', [])
+    global_env_models = config.get('env-models', None)
+
+    # 如果没有指定 current_provider，使用第一个 provider
+    if current_provider is None and len(providers) > 0:
+        current_provider = providers[0].get('name')
+
+    # 生成 SQL 头部注释(表结构见 _SCHEMA_SQL)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    header_lines = [
+        "-- CC Switch SQLite 导出",
+        f"-- 生成时间: {now}",
+        "-- 由 ccp2ccswitch.py 自动生成",
         "",
-        "-- 插入 Claude Code 配置",
-    ])
+    ]
+
+    # 不再添加 skill_repos(用户可能已有配置)
 
     # 构建 common_config_claude
     common_config = {
@@ -319,18 +286,27 @@ def generate_sql_file(config, output_file, current_provider=None, add_prefix=Fal
     common_config_json = json.dumps(common_config, ensure_ascii=False, indent=2)
     common_config_escaped = escape_sql_string(common_config_json)
 
-    sql_lines.append(f"""INSERT INTO "settings" ("key", "value") VALUES ('common_config_claude', '{common_config_escaped}');""")
-
-    sql_lines.extend([
+    # SQL 尾部
+    footer_lines = [
+        "",
+        "-- 插入 Claude Code 配置",
+        f"""INSERT INTO "settings" ("key", "value") VALUES ('common_config_claude', '{common_config_escaped}');""",
         "",
         "COMMIT;",
         "PRAGMA foreign_keys=ON;",
-        ""
-    ])
+    ]
 
-    # 写入文件
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(sql_lines))
+    # 边生成边写入文件，不在内存中拼接完整的 SQL 文本
+    with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.writelines(line + '\n' for line in header_lines)
+        f.write(_SCHEMA_SQL)
+
+        # 每个 provider 单独一条 INSERT：id 重复（如名称全为非 ASCII 字符）时只有该行失败，不影响其他行
+        for index, provider in enumerate(providers, 1):
+            values = provider_to_values(provider, provider.get('name') == current_provider, index, add_prefix, global_env_models)
+            f.write(f'INSERT INTO "providers" {PROVIDER_COLUMNS} VALUES {values};\n')
+
+        f.writelines(line + '\n' for line in footer_lines)
 
     return len([p for p in providers if p.get('name') != 'Note'])
 
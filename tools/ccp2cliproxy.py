@@ -15,6 +15,14 @@ if sys.platform == 'win32':
     import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# 需要从 api_base_url 中移除的常见端点路径（按顺序检查，更具体的路径在前）
+_ENDPOINT_PATHS = ("/anthropic/v1/messages", "/v1/chat/completions", "/v1/messages", "/v1")
+
+# YAML 输出模板（每段以换行开头，与上一段衔接）
+_PROVIDER_TMPL = "\n  - name: {name}\n    base-url: {base_url}\n    api-key-entries:"
+_API_KEY_TMPL = "\n      - api-key: {api_key}"
+_MODEL_TMPL = "\n      - name: {name}\n        alias: \"{alias}\""
+
 
 def provider_to_cliproxy(provider):
     """
@@ -32,9 +40,10 @@ def provider_to_cliproxy(provider):
     api_key = provider.get('api_key', '')
     models = provider.get('models', [])
 
-    # 提取基础 URL - 移除常见的端点路径
+    # 提取基础 URL - 移除第一个出现的常见端点路径
+    # （不能用单个正则交替匹配：交替按出现位置取最左匹配，而不是按列表优先级）
     base_url = api_base_url
-    for endpoint in ["/anthropic/v1/messages", "/v1/chat/completions", "/v1/messages", "/v1"]:
+    for endpoint in _ENDPOINT_PATHS:
         if endpoint in base_url:
             base_url = base_url.replace(endpoint, "")
             break
@@ -77,35 +86,29 @@ def generate_yaml_file(config, output_file):
         cliproxy_providers.append(cliproxy_provider)
 
     # 手动构建 YAML 格式(保持简洁的格式)
-    yaml_lines = [
-        "# CLIProxyAPI 配置文件",
-        f"# 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-        "# 由 ccp2cliproxy.py 自动生成",
-        "",
-        "openai-compatibility:",
-    ]
-
-    # 写入每个 provider
-    for provider in cliproxy_providers:
-        yaml_lines.append(f"  - name: {provider['name']}")
-        yaml_lines.append(f"    base-url: {provider['base-url']}")
-        yaml_lines.append("    api-key-entries:")
-        for entry in provider['api-key-entries']:
-            yaml_lines.append(f"      - api-key: {entry['api-key']}")
-
-        # 如果有模型列表
-        if 'models' in provider and provider['models']:
-            yaml_lines.append("    models:")
-            for model in provider['models']:
-                yaml_lines.append(f"      - name: {model['name']}")
-                yaml_lines.append(f"        alias: \"{model['alias']}\"")
-
-        # 添加空行分隔不同的 provider
-        yaml_lines.append("")
-
-    # 写入文件
+    header = (
+        "# CLIProxyAPI 配置文件\n"
+        f"# 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        "# 由 ccp2cliproxy.py 自动生成\n"
+        "\n"
+        "openai-compatibility:"
+    )
+
+    # 每个 provider 按模板拼成一整段后直接写入文件，不再逐行 append 再 join
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(yaml_lines))
+        f.write(header)
+        for provider in cliproxy_providers:
+            f.write(_PROVIDER_TMPL.format(name=provider['name'], base_url=provider['base-url']))
+            for entry in provider['api-key-entries']:
+                f.write(_API_KEY_TMPL.format(api_key=entry['api-key']))
+
+            # 如果有模型列表
+            if provider.get('models'):
+                f.write("\n    models:")
+                f.write(''.join(_MODEL_TMPL.format(name=m['name'], alias=m['alias']) for m in provider['models']))
+
+            # 添加空行分隔不同的 provider
+            f.write("\n")
 
     return len(cliproxy_providers)
 